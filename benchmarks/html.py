@@ -0,0 +1,118 @@
+# Benchmark for serializing trees to html, run with `python -m benchmarks.html`
+import html
+from time import perf_counter
+
+from pyreact.tree import Tree, SELF_CLOSING, clean_props, to_html
+
+
+ROWS = 5_000
+REPEAT = 10
+
+
+def reference_to_html(tree):
+    # The serializer as it was before to_html wrote into a single buffer, kept
+    # here to compare against
+    if isinstance(tree, str):
+        yield html.escape(tree, quote=False)
+        return
+
+    if tree.tag is None:
+        for child in tree.children.values():
+            yield from reference_to_html(child)
+        return
+
+    yield '<'
+    yield tree.tag
+
+    for key, value in clean_props(tree.props).items():
+        yield ' '
+        yield key
+        if value:
+            yield '="'
+            yield html.escape(value)
+            yield '"'
+
+    if tree.tag in SELF_CLOSING:
+        yield ' />'
+    else:
+        yield '>'
+        for child in tree.children.values():
+            yield from reference_to_html(child)
+        yield '</'
+        yield tree.tag
+        yield '>'
+
+
+def make_row(key):
+    # 10 nodes per row
+    return Tree('tr', {'class': 'row', 'data-key': str(key)}, {
+        ('no_key', 0): Tree('td', {'class': 'id'}, {('text', str(key), 0): str(key)}),
+        ('no_key', 1): Tree('td', {'class': 'name'}, {
+            ('no_key', 0): Tree('a', {'href': f'/items/{key}?a=1&b=2'}, {
+                ('text', 'Item', 0): f'Item <{key % 100}>',
+            }),
+        }),
+        ('no_key', 2): Tree('td', {'class': 'status'}, {
+            ('no_key', 0): Tree('input', {'type': 'checkbox', 'checked': key % 2 == 0}, {}),
+        }),
+        ('no_key', 3): Tree('td', {}, {('text', 'ok', 0): 'ok & done'}),
+    })
+
+
+def make_page(rows):
+    return Tree('html', {}, {
+        ('head',): Tree('head', {}, {}),
+        ('body',): Tree('body', {}, {
+            ('no_key', 0): Tree('table', {}, {
+                ('key', key, 0): row
+                for key, row in rows.items()
+            }),
+        }),
+    })
+
+
+def count_nodes(tree):
+    if isinstance(tree, str):
+        return 1
+    return 1 + sum(map(count_nodes, tree.children.values()))
+
+
+def measure(setup, func):
+    best = None
+    for _ in range(REPEAT):
+        value = setup()
+        start = perf_counter()
+        func(value)
+        duration = perf_counter() - start
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+def main():
+    rows = {key: make_row(key) for key in range(ROWS)}
+    page = make_page(rows)
+    assert ''.join(reference_to_html(page)) == str(page)
+
+    # Like after a rerender, the new page shares all but one row with the
+    # page that was serialized before
+    def rerendered_page():
+        rows[0] = make_row(0)
+        return make_page(rows)
+
+    def new_page():
+        return make_page({key: make_row(key) for key in range(ROWS)})
+
+    print(f'nodes: {count_nodes(page)}')
+    results = {
+        'reference': measure(new_page, lambda page: ''.join(reference_to_html(page))),
+        'str (new page)': measure(new_page, str),
+        'str (rerender)': measure(rerendered_page, str),
+        'to_html (4096 chunks)': measure(rerendered_page, lambda page: list(to_html(page, 4096))),
+    }
+    for name, duration in results.items():
+        print(f'{name:<20} {duration * 1000:>10.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+# Benchmark for diffing keyed lists, run with `python -m benchmarks.keyed_diff`
+import random
+from collections import Counter
+from time import perf_counter
+
+from pyreact.tree import Tree, diff
+
+
+SIZES = [100, 1_000, 10_000]
+REPEAT = 5
+
+
+def make_row(key):
+    return Tree('tr', {'key': key}, {
+        ('no_key', 0): Tree('td', {}, {('text', str(key), 0): str(key)}),
+    })
+
+
+def make_table(rows, keys):
+    return Tree('table', {}, {('key', key, 0): rows[key] for key in keys})
+
+
+def scenarios(keys, rng):
+    size = len(keys)
+    middle = size // 2
+    yield 'append', [*keys, size]
+    yield 'prepend', [size, *keys]
+    yield 'insert', [*keys[:middle], size, *keys[middle:]]
+    yield 'remove', [*keys[:middle], *keys[middle + 1:]]
+    yield 'swap', [keys[-1], *keys[1:-1], keys[0]]
+    yield 'move', [*keys[1:], keys[0]]
+    yield 'reverse', keys[::-1]
+    yield 'sort', sorted(keys, key=lambda key: (key % 7, key))
+    yield 'shuffle', rng.sample(keys, size)
+
+
+def main():
+    rng = random.Random(0)
+
+    print(f'{"size":>8} {"scenario":<10} {"ms":>10}  actions')
+    for size in SIZES:
+        keys = list(range(size))
+        rows = {key: make_row(key) for key in range(size + 1)}
+
+        for name, new_keys in scenarios(keys, rng):
+            best = None
+            for _ in range(REPEAT):
+                old_tree = make_table(rows, keys)
+                new_tree = make_table(rows, new_keys)
+                start = perf_counter()
+                actions = list(diff(old_tree, new_tree))
+                duration = perf_counter() - start
+                if best is None or duration < best:
+                    best = duration
+
+            counts = Counter(action for action, *_ in actions)
+            counts = ', '.join(f'{action}: {count}' for action, count in sorted(counts.items()))
+            print(f'{size:>8} {name:<10} {best * 1000:>10.2f}  {counts}')
+
+
+if __name__ == '__main__':
+    main()
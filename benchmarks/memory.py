@@ -0,0 +1,64 @@
+# Benchmark for the memory used per node, run with `python -m benchmarks.memory`
+import asyncio
+import gc
+import tracemalloc
+
+from pyreact import component, h, use_state, use_callback
+from pyreact.render import render
+
+
+ROWS = 2_000
+
+
+@component
+def row(index, key=None):
+    selected, set_selected = use_state(False)
+
+    @use_callback(set_selected)
+    def handle_click(e):
+        set_selected(lambda selected: not selected)
+
+    return h.tr({'class': 'selected' if selected else 'row'})(
+        h.td({'class': 'id'})(str(index)),
+        h.td({'class': 'name'})(h.a(href=f'/items/{index}', onclick=handle_click)(f'Item {index}')),
+        h.td()(h.input(type='checkbox', checked=selected)),
+    )
+
+
+@component
+def table(rows):
+    return h.table(h.tbody(*(row(index=index, key=index) for index in range(rows))))
+
+
+def count_nodes(tree):
+    if isinstance(tree, str):
+        return 1
+    return 1 + sum(map(count_nodes, tree.children.values()))
+
+
+async def measure(rows):
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+
+    renders = render(table(rows=rows))
+    tree, _ = await anext(renders)
+
+    gc.collect()
+    end, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    nodes = count_nodes(tree)
+    await renders.aclose()
+    return nodes, end - start
+
+
+def main():
+    nodes, size = asyncio.run(measure(ROWS))
+    print(f'nodes: {nodes}')
+    print(f'total: {size / 1024 / 1024:.2f} MiB')
+    print(f'per node: {size / nodes:.0f} bytes')
+
+
+if __name__ == '__main__':
+    main()
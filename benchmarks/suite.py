@@ -0,0 +1,323 @@
+# Benchmark suite, run with `python -m benchmarks.suite > results.json`.
+# Results are written as json, pass `--compare results.json` to compare a new
+# run against an earlier one.
+import argparse
+import asyncio
+import json
+import platform
+import random
+import re
+import subprocess
+import sys
+from statistics import mean
+from time import perf_counter
+
+from pyreact import component, h, use_state
+from pyreact.render import render
+from pyreact.tree import diff, to_html
+from pyreact.web import App
+
+from . import keyed_diff, html, memory
+
+
+WIDE_ROWS = 5_000
+DEEP_DEPTH = 100
+RERENDER_ROWS = 2_000
+DIFF_SIZES = [1_000, 10_000]
+DIFF_SCENARIOS = ['append', 'insert', 'move', 'shuffle']
+HTML_ROWS = 5_000
+ROUND_TRIPS = 200
+REPEAT = 10
+
+
+@component
+def wide_row(index, key=None):
+    return h.tr(
+        h.td({'class': 'id'})(str(index)),
+        h.td({'class': 'name'})(h.a(href=f'/items/{index}')(f'Item {index}')),
+    )
+
+
+@component
+def wide_table(rows):
+    return h.table(h.tbody(*(wide_row(index=index, key=index) for index in range(rows))))
+
+
+@component
+def deep(depth):
+    if not depth:
+        return h.span('leaf')
+    return h.div({'class': f'level-{depth}'})(deep(depth=depth - 1))
+
+
+@component
+def stateful_row(index, key=None):
+    selected, set_selected = use_state(False)
+
+    def handle_click(event):
+        set_selected(lambda selected: not selected)
+
+    return h.tr({'class': 'selected' if selected else 'row', 'onclick': handle_click})(
+        h.td(str(index)),
+        h.td(h.input(type='checkbox', checked=selected)),
+    )
+
+
+@component
+def stateful_table(rows):
+    offset, set_offset = use_state(0)
+
+    def handle_click(event):
+        set_offset(lambda offset: offset + 1)
+
+    return h.table({'onclick': handle_click})(h.tbody(*(
+        stateful_row(index=index + offset, key=index)
+        for index in range(rows)
+    )))
+
+
+@component
+def counter():
+    count, set_count = use_state(0)
+
+    def handle_click(event):
+        set_count(lambda count: count + 1)
+
+    return h.button(onclick=handle_click)(f'count: {count}')
+
+
+def summarize(durations, **extra):
+    return {
+        'best_ms': min(durations) * 1000,
+        'mean_ms': mean(durations) * 1000,
+        'runs': len(durations),
+        **extra,
+    }
+
+
+def measure(func, setup=lambda: None, repeat=REPEAT):
+    durations = []
+    for _ in range(repeat):
+        value = setup()
+        start = perf_counter()
+        func(value)
+        durations.append(perf_counter() - start)
+    return durations
+
+
+async def measure_render(node, repeat=REPEAT):
+    durations = []
+    for _ in range(repeat):
+        renders = render(node)
+        start = perf_counter()
+        await anext(renders)
+        durations.append(perf_counter() - start)
+        await renders.aclose()
+    return durations
+
+
+async def measure_rerender(get_callback, repeat=REPEAT):
+    # Calls the callback that get_callback finds in the rendered tree, like an
+    # event from the client, and measures until the next render is done
+    renders = render(stateful_table(rows=RERENDER_ROWS))
+    tree, _ = await anext(renders)
+    durations = []
+    for _ in range(repeat):
+        get_callback(tree)(None)
+        start = perf_counter()
+        tree, _ = await anext(renders)
+        durations.append(perf_counter() - start)
+    await renders.aclose()
+    return durations
+
+
+def bench_render():
+    return {
+        'render.wide': summarize(
+            asyncio.run(measure_render(wide_table(rows=WIDE_ROWS))),
+            rows=WIDE_ROWS,
+        ),
+        'render.deep': summarize(
+            asyncio.run(measure_render(deep(depth=DEEP_DEPTH))),
+            depth=DEEP_DEPTH,
+        ),
+    }
+
+
+def bench_rerender():
+    middle = RERENDER_ROWS // 2
+    return {
+        'rerender.state_one_row': summarize(
+            asyncio.run(measure_rerender(lambda tree: tree[0][middle]['onclick'])),
+            rows=RERENDER_ROWS,
+        ),
+        'rerender.state_all_rows': summarize(
+            asyncio.run(measure_rerender(lambda tree: tree['onclick'])),
+            rows=RERENDER_ROWS,
+        ),
+    }
+
+
+def bench_diff():
+    results = {}
+    rng = random.Random(0)
+    for size in DIFF_SIZES:
+        keys = list(range(size))
+        rows = {key: keyed_diff.make_row(key) for key in range(size + 1)}
+        for name, new_keys in keyed_diff.scenarios(keys, rng):
+            if name not in DIFF_SCENARIOS:
+                continue
+            old_tree = keyed_diff.make_table(rows, keys)
+            new_tree = keyed_diff.make_table(rows, new_keys)
+            actions = list(diff(old_tree, new_tree))
+            results[f'diff.{name}.{size}'] = summarize(
+                measure(lambda _: list(diff(old_tree, new_tree))),
+                rows=size,
+                actions=len(actions),
+            )
+    return results
+
+
+def bench_html():
+    rows = {key: html.make_row(key) for key in range(HTML_ROWS)}
+
+    def new_page():
+        return html.make_page({key: html.make_row(key) for key in range(HTML_ROWS)})
+
+    def rerendered_page():
+        rows[0] = html.make_row(0)
+        return html.make_page(rows)
+
+    nodes = html.count_nodes(new_page())
+    return {
+        'to_html.new_page': summarize(measure(str, new_page), nodes=nodes),
+        'to_html.rerendered_page': summarize(measure(str, rerendered_page), nodes=nodes),
+        'to_html.chunked': summarize(
+            measure(lambda page: list(to_html(page, 4096)), rerendered_page),
+            nodes=nodes,
+        ),
+    }
+
+
+async def measure_round_trips():
+    # Drives App through asgi with in process receive and send, every round
+    # trip is a click from the client until the patch is sent back
+    app = App(counter())
+
+    sent = []
+
+    async def http_receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def http_send(message):
+        sent.append(message)
+
+    await app({'type': 'http', 'path': '/'}, http_receive, http_send)
+    body = b''.join(message.get('body', b'') for message in sent).decode()
+    session_id = re.search(r'session=([^"]+)"', body).group(1)
+
+    received = asyncio.Queue()
+    sent = asyncio.Queue()
+    await received.put({'type': 'websocket.connect'})
+    task = asyncio.create_task(app(
+        {'type': 'websocket', 'path': f'/{session_id}'},
+        received.get,
+        sent.put,
+    ))
+    assert (await sent.get())['type'] == 'websocket.accept'
+
+    # html, body, button
+    click = json.dumps(['click', 0, 1, 0, {}])
+    durations = []
+    for _ in range(ROUND_TRIPS):
+        start = perf_counter()
+        await received.put({'type': 'websocket.receive', 'text': click})
+        message = await sent.get()
+        durations.append(perf_counter() - start)
+        assert message['type'] == 'websocket.send'
+
+    await received.put({'type': 'websocket.disconnect'})
+    await task
+    return durations
+
+
+def bench_websocket():
+    return {'websocket.round_trip': summarize(asyncio.run(measure_round_trips()))}
+
+
+def bench_memory():
+    nodes, size = asyncio.run(memory.measure(memory.ROWS))
+    return {'memory.render': {'bytes_per_node': size / nodes, 'nodes': nodes}}
+
+
+BENCHMARKS = {
+    'render': bench_render,
+    'rerender': bench_rerender,
+    'diff': bench_diff,
+    'to_html': bench_html,
+    'websocket': bench_websocket,
+    'memory': bench_memory,
+}
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(before, after, file):
+    # Prints the ratio of the best times, or bytes for memory, of all
+    # benchmarks that are in both results
+    for name, result in after['benchmarks'].items():
+        try:
+            prev_result = before['benchmarks'][name]
+        except KeyError:
+            continue
+        key = 'best_ms' if 'best_ms' in result else 'bytes_per_node'
+        ratio = result[key] / prev_result[key]
+        print(
+            f'{name:<28} {prev_result[key]:>12.2f} {result[key]:>12.2f} {ratio:>8.2f}x',
+            file=file,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.suite')
+    parser.add_argument(
+        'benchmarks',
+        nargs='*',
+        metavar='NAME',
+        help=f'benchmarks to run, all by default: {", ".join(BENCHMARKS)}',
+    )
+    parser.add_argument('--compare', metavar='PATH', help='results of an earlier run')
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f'unknown benchmark: {name}')
+
+    results = {
+        'commit': get_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'benchmarks': {},
+    }
+    for name in args.benchmarks or BENCHMARKS:
+        results['benchmarks'].update(BENCHMARKS[name]())
+
+    json.dump(results, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(json.load(f), results, sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
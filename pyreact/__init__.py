@@ -1,8 +1,13 @@
-from .node import component, h, fragment, stop_propagation, prevent_default
+from .node import component, memo, h, fragment, stop_propagation, prevent_default
 from .hooks import use_ref, use_state, use_memo, use_callback
+from .render import batch, flush_sync
+from .tracing import Tracer
+from .profiler import Profiler
 
 
 __all__ = [
-    'component', 'h', 'fragment', 'stop_propagation', 'prevent_default',
+    'component', 'memo', 'h', 'fragment', 'stop_propagation', 'prevent_default',
     'use_ref', 'use_state', 'use_memo', 'use_callback',
+    'batch', 'flush_sync',
+    'Tracer', 'Profiler',
 ]
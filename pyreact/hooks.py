@@ -16,20 +16,30 @@ def get_rerender():
 def use_state(init_value=None):
     ref = use_ref()
 
-    if not hasattr(ref, 'value'):
-        if callable(init_value):
-            init_value = init_value()
-
-        ref.value = init_value
+    if not hasattr(ref, 'set_value'):
+        # The value can already be there when it is restored from a snapshot
+        if not hasattr(ref, 'value'):
+            if callable(init_value):
+                init_value = init_value()
+            ref.value = init_value
+
+        context = CONTEXT.get()
         rerender = get_rerender()
 
         def set_value(value):
-            if callable(value):
-                value = value(ref.value)
-            ref.value = value 
+            try:
+                location = ref.location
+            except AttributeError:
+                if callable(value):
+                    value = value(ref.value)
+                ref.value = value 
+            else:
+                # The tree of this ref was closed, see Context.detach
+                context.update_ref(location, 'value', value)
             rerender()
 
         ref.set_value = set_value
+        ref.persistent = ('value',)
 
     return ref.value, ref.set_value
 
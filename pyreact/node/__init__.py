@@ -1,6 +1,6 @@
 from .node import to_node
-from .component import component
+from .component import component, memo
 from .element import h, fragment, prevent_default, stop_propagation
 
 
-__all__ = ['to_node', 'component', 'h', 'fragment', 'prevent_default', 'stop_propagation']
+__all__ = ['to_node', 'component', 'memo', 'h', 'fragment', 'prevent_default', 'stop_propagation']
@@ -1,42 +1,135 @@
+from collections import OrderedDict
+from time import perf_counter
 from types import SimpleNamespace
 
-from .node import Node, to_node
+from .node import Node, to_node, hash_props
+from .element import Callback
 from ..render import push_context, set_next_ref, CONTEXT
+from ..tree import Tree
+
+
+# Results of static components by render function and props, shared between
+# all renders. When full the least recently used result is dropped.
+STATIC_CACHE = OrderedDict()
+STATIC_CACHE_SIZE = 1024
 
 
 class Component(Node):
 
-    def __init__(self, render_func, props, children):
+    __slots__ = ('_render_func', '_static', '_memo', '_last_cmp')
+
+    def __init__(self, render_func, props, children, static=False, memo=None):
         super().__init__(props, children)
         self._render_func = render_func
+        self._static = static
+        self._memo = memo
+        self._last_cmp = None
 
     def _copy(self, props, children):
-        return Component(self._render_func, props, children)
+        return Component(self._render_func, props, children, self._static, self._memo)
+
+    def _fingerprint(self):
+        # Memoized components decide for themselves which props matter, so
+        # only the render function can be part of their hash
+        if self._memo is not None:
+            return hash((Component, self._render_func))
+        return hash((Component, self._render_func, hash_props(self._props), self._children))
+
+    def __eq__(self, other):
+        # Parents compare their children before they rerender them, which
+        # compares them again right away, so the result is kept until then.
+        if self is other:
+            return True
+        res = self._cmp(other)
+        self._last_cmp = other, res
+        if type(other) is Component:
+            # Otherwise every node would keep all nodes before it alive
+            other._last_cmp = None
+        return res == 'equal'
+
+    __hash__ = Node.__hash__
 
     def _cmp(self, other):
-        if not isinstance(other, Component) or self._render_func != other._render_func:
+        last_cmp = self._last_cmp
+        if last_cmp is not None:
+            # The result is only used once, so this node does not keep the
+            # node it replaced alive after it was rendered
+            self._last_cmp = None
+            if last_cmp[0] is other:
+                return last_cmp[1]
+
+        if self is other:
+            return 'equal'
+        elif type(other) is not Component or self._render_func != other._render_func:
             return 'incompatible'
-        elif self._props != other._props or self._children != other._children:
+        elif self._memo is not None:
+            if self._memo(other._get_props(), self._get_props()):
+                return 'equal'
+            else:
+                return 'compatible'
+        elif (
+            self._props != other._props or
+            hash(self) != hash(other) or
+            self._children != other._children
+        ):
             return 'compatible'
         else:
             return 'equal'
 
     def _render(self):
+        if self._static:
+            cached = self._get_static()
+            if cached is not None:
+                return cached
+            ref_count = CONTEXT.get().ref_count
+
         refs = []
 
+        context = CONTEXT.get()
+        if context.restore:
+            restore = context.restore.get(tuple(context.path), ())
+        else:
+            restore = ()
+
         def next_ref():
-            ref = SimpleNamespace()
+            if len(refs) < len(restore):
+                ref = SimpleNamespace(**restore[len(refs)])
+            else:
+                ref = SimpleNamespace()
             refs.append(ref)
+            context.ref_count += 1
             return ref
 
+        if context.tracer is not None:
+            start = perf_counter()
         with set_next_ref(next_ref):
             node = self._get_node()
+        if context.tracer is not None:
+            duration = perf_counter() - start
+            context.tracer.component_rendered(tuple(context.path), self, duration, len(refs), 'mount')
+        context.callback_context = None
 
         with push_context('render'):
             state, result = node._render()
-        return (tuple(refs), node, state), result
+
+        if self._static and context.ref_count == ref_count:
+            # No refs were used in the whole subtree, which is marked by None
+            # instead of the refs so rerenders know there is no state to keep
+            state = None, node, state
+            self._set_static(state, result)
+        else:
+            state = tuple(refs), node, state
+        return state, result
 
     def _rerender(self, state, result):
+        if state[0] is None:
+            # Static components without any state in their subtree are
+            # rendered from scratch, so the result can come from the cache
+            self._unmount(state, result)
+            context = CONTEXT.get()
+            context.rerender_paths.poptree(context.path)
+            return self._render()
+
         refs, prev_node, state = state
         ref_iter = iter(refs)
 
@@ -46,10 +139,24 @@ class Component(Node):
             except StopIteration:
                 raise AssertionError('more refs used than previous render')
 
+        # Rendering covers any pending rerender of this component, if there
+        # is one this render is caused by its own state
+        context = CONTEXT.get()
+        if context.rerender_paths and context.rerender_paths.discard(context.path):
+            reason = 'state'
+        else:
+            reason = 'parent'
+
+        if context.tracer is not None:
+            start = perf_counter()
         with set_next_ref(next_ref):
             next_node = self._get_node()
+        if context.tracer is not None:
+            duration = perf_counter() - start
+            context.tracer.component_rendered(tuple(context.path), self, duration, len(refs), reason)
 
         assert next(ref_iter, None) is None, 'less refs used than previous render'
+        context.callback_context = None
 
         match next_node._cmp(prev_node):
             case 'equal':
@@ -60,26 +167,63 @@ class Component(Node):
             case 'incompatible':
                 with push_context('render'):
                     prev_node._unmount(state, result)
-                    context = CONTEXT.get()
                     context.rerender_paths.poptree(context.path)
                     state, result = next_node._render()
 
         return (refs, next_node, state), result
 
-    def _get_node(self):
+    def _get_static(self):
+        key = self._static_key()
+        try:
+            children, state, result = STATIC_CACHE[key]
+        except (KeyError, TypeError):
+            return None
+        if children != self._children:
+            return None
+        STATIC_CACHE.move_to_end(key)
+        return state, result
+
+    def _set_static(self, state, result):
+        # Results that use hooks or contain callbacks are bound to the
+        # session that rendered them, so they can not be shared
+        if has_callbacks(result):
+            return
+        try:
+            key = self._static_key()
+            hash(key)
+        except TypeError:
+            return
+        if isinstance(result, Tree):
+            result.cache_html()
+        STATIC_CACHE[key] = self._children, state, result
+        STATIC_CACHE.move_to_end(key)
+        while len(STATIC_CACHE) > STATIC_CACHE_SIZE:
+            STATIC_CACHE.popitem(last=False)
+
+    def _static_key(self):
+        return self._render_func, tuple(self._props.items())
+
+    def _get_props(self):
         if self._children:
-            props = {**self._props, 'children': self._children}
-        else:
-            props = self._props
-        return to_node(self._render_func(**props))
+            return {**self._props, 'children': self._children}
+        return self._props
+
+    def _get_node(self):
+        return to_node(self._render_func(**self._get_props()))
 
     def _unmount(self, state, result):
         refs, node, state = state
         with push_context('render'):
             node._unmount(state, result)
-        for ref in refs:
+        for ref in refs or ():
             pop_cleanup(ref)
 
+    def _collect_refs(self, state, path, refs):
+        component_refs, node, state = state
+        if component_refs:
+            refs[path] = component_refs
+        node._collect_refs(state, (*path, 'render'), refs)
+
     def _extract(self, state, result, key):
         if key != 'render':
             raise KeyError(key)
@@ -102,5 +246,59 @@ def pop_cleanup(ref):
     cleanup()
 
 
-def component(render_func):
-    return Component(render_func, {}, ())
+def has_callbacks(tree):
+    if isinstance(tree, str):
+        return False
+    return (
+        any(isinstance(value, Callback) for value in tree.props.values()) or
+        any(map(has_callbacks, tree.children.values()))
+    )
+
+
+# Types that are compared by value instead of identity by is_shallow_equal
+VALUE_TYPES = (str, int, float, bool, bytes, type(None))
+
+
+def is_shallow_equal(prev_props, next_props):
+    if prev_props.keys() != next_props.keys():
+        return False
+
+    for key, next_value in next_props.items():
+        prev_value = prev_props[key]
+        if prev_value is next_value:
+            continue
+        if key == 'children':
+            if len(prev_value) != len(next_value) or any(
+                prev_child is not next_child
+                for prev_child, next_child in zip(prev_value, next_value)
+            ):
+                return False
+        elif not (
+            type(prev_value) is type(next_value) and
+            type(next_value) in VALUE_TYPES and
+            prev_value == next_value
+        ):
+            return False
+
+    return True
+
+
+def component(render_func=None, /, *, static=False, memo=False):
+    # Static components are rendered once per props and then shared between
+    # all sessions, only use this for components that do not use hooks and
+    # render the same for the same props. For memo see the memo function.
+    if render_func is None:
+        return lambda render_func: component(render_func, static=static, memo=memo)
+    if memo is True:
+        memo = is_shallow_equal
+    elif memo is False:
+        memo = None
+    return Component(render_func, {}, (), static, memo)
+
+
+def memo(node, are_equal=is_shallow_equal):
+    # Memoized components are not rendered again by their parent when
+    # are_equal(prev_props, next_props) is true, by default when all props
+    # and children are the same objects. They still render again when their
+    # own state changes.
+    return Component(node._render_func, node._props, node._children, node._static, are_equal)
@@ -1,15 +1,19 @@
+import sys
 from collections import Counter
 from contextvars import copy_context
 from functools import partial
 
-from .node import Node
+from .node import Node, hash_props
 from .text import Text
+from ..persistent import PersistentDict
 from ..render import push_context, CONTEXT
 from ..tree import Tree
 
 
 class Element(Node):
 
+    __slots__ = ('_tag',)
+
     def __init__(self, tag, props, children):
         super().__init__(props, children)
         self._tag = tag
@@ -17,28 +21,47 @@ class Element(Node):
     def _copy(self, props, children):
         return Element(self._tag, props, children)
 
+    def _fingerprint(self):
+        return hash((Element, self._tag, hash_props(self._props), self._children))
+
     def _cmp(self, other):
-        if not isinstance(other, Element) or self._tag != other._tag:
+        if self is other:
+            return 'equal'
+        elif type(other) is not Element or self._tag != other._tag:
             return 'incompatible'
-        elif self._props != other._props or self._children != other._children:
+        elif (
+            self._props != other._props or
+            hash(self) != hash(other) or
+            self._children != other._children
+        ):
             return 'compatible'
         else:
             return 'equal'
 
     def _render(self):
-        return self._rerender({}, {})
+        return self._rerender(PersistentDict(), None)
 
     def _rerender(self, prev_state, prev_result):
-        prev_state = prev_state.copy()
+        prev_state = dict(prev_state.items())
         next_state = {}
         next_children = {}
         key_counter = Counter()
 
-        props = {}
-        for key, value in self._props.items():
+        # Only copy the props when there are callbacks to wrap, so elements
+        # without callbacks share their props with their result. Callbacks of
+        # the previous result are reused if they wrap the same function.
+        props = self._props
+        for key, value in props.items():
             if callable(value) and not isinstance(value, Callback):
-                value = Callback(value)
-            props[key] = value
+                if props is self._props:
+                    props = dict(props)
+                try:
+                    callback = prev_result.props[key]
+                except (AttributeError, KeyError):
+                    callback = None
+                if not is_callback_for(callback, value):
+                    callback = Callback(value, get_callback_context())
+                props[key] = callback
 
         for child in self._children:
             if isinstance(child, Text):
@@ -82,11 +105,27 @@ class Element(Node):
             result = prev_result.children[key]
             with push_context(key):
                 prev_child._unmount(state, result)
-                context = CONTEXT.get()
-                context.rerender_paths.poptree(context.path)
 
-        next_result = Tree(self._tag, props, next_children)
-        return next_state, next_result
+        if prev_state:
+            # Drop the dirty paths of all removed children at once
+            context = CONTEXT.get()
+            context.rerender_paths.prune(context.path, prev_state)
+
+        if prev_result is None:
+            return PersistentDict(next_state), Tree(self._tag, props, next_children)
+
+        # Reuse the previous result where possible so unchanged subtrees keep
+        # their identity
+        if props == prev_result.props:
+            props = prev_result.props
+        if is_same_children(next_children, prev_result.children):
+            if props is prev_result.props:
+                return PersistentDict(next_state), prev_result
+            next_children = prev_result.children
+        elif props is prev_result.props:
+            return PersistentDict(next_state), prev_result.with_children(next_children)
+
+        return PersistentDict(next_state), Tree(self._tag, props, next_children)
 
     def _unmount(self, state, result):
         for key, (child, child_state) in state.items():
@@ -94,6 +133,10 @@ class Element(Node):
             with push_context(key):
                 child._unmount(child_state, child_result)
 
+    def _collect_refs(self, state, path, refs):
+        for key, (child, child_state) in state.items():
+            child._collect_refs(child_state, (*path, key), refs)
+
     def _extract(self, state, result, key):
         node, state = state[key]
         result = result.children[key]
@@ -101,23 +144,48 @@ class Element(Node):
 
     def _inject(self, state, result, key, child_state, child_result):
         node, _ = state[key]
-        state = {**state, key: (node, child_state)}
-        result = Tree(result.tag, result.props, {**result.children, key: child_result})
+        state = state.set(key, (node, child_state))
+        children = result.children.set(key, child_result)
+        if children is not result.children:
+            result = result.with_children(children)
         return state, result
 
 
+def is_same_children(children, prev_children):
+    if len(children) != len(prev_children):
+        return False
+
+    for (key, child), (prev_key, prev_child) in zip(children.items(), prev_children.items()):
+        if key != prev_key or child is not prev_child:
+            return False
+
+    return True
+
+
 class ElementFactory:
 
+    # Elements are immutable so the empty element for every tag is created
+    # once, attributes are cached on the instance so __getattr__ is only
+    # called the first time a tag is used.
+
     def __getattr__(self, name):
-        return Element(name, {}, ())
+        element = self[name]
+        setattr(self, name, element)
+        return element
 
     def __getitem__(self, name):
-        return Element(name, {}, ())
+        try:
+            return ELEMENTS[name]
+        except KeyError:
+            element = ELEMENTS[name] = Element(sys.intern(name), {}, ())
+            return element
 
 
 class Callback:
 
-    def __init__(self, callback):
+    __slots__ = ('callback', 'context', 'prevent_default', 'stop_propagation')
+
+    def __init__(self, callback, context=None):
         if isinstance(callback, Callback):
             self.callback = callback.callback
             self.context = callback.context
@@ -125,7 +193,7 @@ class Callback:
             self.stop_propagation = callback.stop_propagation
         else:
             self.callback = callback
-            self.context = copy_context()
+            self.context = copy_context() if context is None else context
             self.prevent_default = False
             self.stop_propagation = False
 
@@ -136,6 +204,24 @@ class Callback:
         return self.context.run(self.callback, *args, **kwargs)
 
 
+def is_callback_for(callback, func):
+    return (
+        isinstance(callback, Callback) and
+        callback.callback is func and
+        not callback.prevent_default and
+        not callback.stop_propagation
+    )
+
+
+def get_callback_context():
+    # Callbacks run in a copy of the context they were rendered in, this copy
+    # is made once per component render and shared by all its callbacks.
+    context = CONTEXT.get()
+    if context.callback_context is None:
+        context.callback_context = copy_context()
+    return context.callback_context
+
+
 def prevent_default(callback):
     callback = Callback(callback)
     callback.prevent_default = True
@@ -148,5 +234,6 @@ def stop_propagation(callback):
     return callback
 
 
+ELEMENTS = {}
 h = ElementFactory()
 fragment = Element(None, {}, ())
@@ -4,10 +4,17 @@ from collections.abc import Mapping
 
 class Node(ABC):
 
+    # Nodes are immutable, so their hash is computed once when first needed.
+    # Equal nodes always have the same hash, so most changed subtrees can be
+    # told apart by their hash instead of by walking them.
+
+    __slots__ = ('_props', '_children', '_hash')
+
     def __init__(self, props, children):
         assert 'children' not in props
         self._props = props
         self._children = tuple(map(to_node, children))
+        self._hash = None
 
     def __call__(self, *args, **kwargs):
         props = dict(self._props)
@@ -24,12 +31,21 @@ class Node(ABC):
         return self._copy(props, children)
 
     def __eq__(self, other):
-        return self._cmp(other) == 'equal'
+        return self is other or self._cmp(other) == 'equal'
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = self._fingerprint()
+        return self._hash
 
     @abstractmethod
     def _copy(self, props, children):
         raise NotImplementedError
 
+    @abstractmethod
+    def _fingerprint(self):
+        raise NotImplementedError
+
     @abstractmethod
     def _cmp(self, other):
         raise NotImplementedError
@@ -46,6 +62,10 @@ class Node(ABC):
     def _unmount(self, state, result):
         raise NotImplementedError
 
+    @abstractmethod
+    def _collect_refs(self, state, path, refs):
+        raise NotImplementedError
+
     @abstractmethod
     def _extract(self, state, result, key):
         raise NotImplementedError
@@ -55,6 +75,24 @@ class Node(ABC):
         raise NotImplementedError
 
 
+def hash_props(props):
+    if not props:
+        return 0
+    try:
+        return hash(frozenset(props.items()))
+    except TypeError:
+        pass
+    # Values that can not be hashed only count by their type, so props that
+    # are equal still always get the same hash
+    hashes = []
+    for key, value in props.items():
+        try:
+            hashes.append((key, hash(value)))
+        except TypeError:
+            hashes.append((key, hash(type(value))))
+    return hash(frozenset(hashes))
+
+
 def to_node(value):
     from .text import Text
     from .element import Element
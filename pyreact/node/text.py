@@ -3,6 +3,8 @@ from .node import Node
 
 class Text(Node):
 
+    __slots__ = ('_content',)
+
     def __init__(self, content):
         super().__init__({}, ())
         self._content = content
@@ -11,8 +13,11 @@ class Text(Node):
         assert props == {} and children == ()
         return self
 
+    def _fingerprint(self):
+        return hash((Text, self._content))
+
     def _cmp(self, other):
-        if isinstance(other, Text) and self._content == other._content:
+        if type(other) is Text and self._content == other._content:
             return 'equal'
         else:
             return 'incompatible'
@@ -26,6 +31,9 @@ class Text(Node):
     def _unmount(self, state, result):
         pass
 
+    def _collect_refs(self, state, path, refs):
+        pass
+
     def _extract(self, state, result, key):
         raise KeyError(key)
 
@@ -1,109 +1,181 @@
-from collections.abc import MutableMapping
+class Paths:
 
+    # A set of paths stored as a trie. Every node keeps the number of paths in
+    # its subtree, so the size is known without walking the trie and empty
+    # subtrees can be pruned right away. Iteration yields ancestors before
+    # their descendants. Siblings come in the order they were first added,
+    # not in their order in the tree, so nothing should depend on that.
 
-VALUE = object()
+    __slots__ = ('_children', '_marked', '_size')
 
+    def __init__(self, paths=()):
+        self._children = {}
+        self._marked = False
+        self._size = 0
+        for path in paths:
+            self.add(path)
 
-class Paths(MutableMapping):
-
-    def __init__(self):
-        self._data = {}
-
-    def __getitem__(self, path):
-        data = self._data
-        for key in path:
-            data = data[key]
-        return data[VALUE]
-
-    def __setitem__(self, path, value):
-        data = self._data
-        for key in path:
-            data = data.setdefault(key, {})
-        data[VALUE] = value
-
-    def __delitem__(self, path):
-        data = self._data
-        stack = []
-
-        for key in path:
-            stack.append(data)
-            data = data[key]
-
-        del data[VALUE]
+    def __len__(self):
+        return self._size
 
-        while not data and stack:
-            data = stack.pop()
-            del data[path[len(stack)]]
+    def __contains__(self, path):
+        node = self._find(path)
+        return node is not None and node._marked
 
-    def items(self):
-        try:
-            value = self._data[VALUE]
-        except KeyError:
-            pass
-        else:
-            yield (), value
-        
-        stack = [((), iter(self._data.items()))]
+    def __iter__(self):
+        if self._marked:
+            yield ()
 
+        stack = [((), iter(self._children.items()))]
         while stack:
-            path, items = stack[-1]
+            path, children = stack[-1]
             try:
-                key, value = next(items)
+                key, node = next(children)
             except StopIteration:
                 stack.pop()
                 continue
-            if key is VALUE:
-                continue
 
             subpath = (*path, key)
-            try:
-                subvalue = value[VALUE]
-            except KeyError:
-                pass
-            else:
-                yield subpath, subvalue
-            stack.append((subpath, iter(value.items())))
-        
-    def __iter__(self):
-        for key, _ in self.items():
-            yield key
+            if node._marked:
+                yield subpath
+            if node._children:
+                stack.append((subpath, iter(node._children.items())))
 
-    def values(self):
-        for _, value in self.items():
-            yield value
+    def __repr__(self):
+        return f'Paths({list(self)!r})'
 
-    def __len__(self):
-        res = 0
-        for _ in self.items():
-            res += 1
-        return res
+    def _find(self, path):
+        node = self
+        for key in path:
+            try:
+                node = node._children[key]
+            except KeyError:
+                return None
+        return node
 
-    def clear(self):
-        self._data.clear()
+    def add(self, path):
+        nodes = [self]
+        for key in path:
+            children = nodes[-1]._children
+            try:
+                node = children[key]
+            except KeyError:
+                node = children[key] = Paths()
+            nodes.append(node)
+
+        if nodes[-1]._marked:
+            return
+        nodes[-1]._marked = True
+        for node in nodes:
+            node._size += 1
+
+    def cover(self, path):
+        # Adds path unless an ancestor is already in the set, and removes all
+        # descendants of path. For when a path stands for its whole subtree.
+        node = self
+        for key in path:
+            if node._marked:
+                return
+            node = node._children.get(key)
+            if node is None:
+                break
+        else:
+            if node._marked:
+                return
+            self.poptree(path)
+        self.add(path)
+
+    def discard(self, path):
+        # Removes path if it is in the set, returns if it was
+        nodes = [self]
+        for key in path:
+            try:
+                nodes.append(nodes[-1]._children[key])
+            except KeyError:
+                return False
+
+        if not nodes[-1]._marked:
+            return False
+        nodes[-1]._marked = False
+        self._remove(path, nodes, 1)
+        return True
+
+    def first(self):
+        # The path that comes first in iteration order, or None if empty
+        if not self._size:
+            return None
+        path = []
+        node = self
+        while not node._marked:
+            key, node = next(iter(node._children.items()))
+            path.append(key)
+        return tuple(path)
 
     def poptree(self, path):
-        try:
-            *path, last_key = path
-        except ValueError:
+        # Removes path and all its descendants, returns them as paths
+        # relative to path
+        if not path:
             res = Paths()
-            res._data = self._data
-            self._data = {}
+            res._children, self._children = self._children, {}
+            res._marked, self._marked = self._marked, False
+            res._size, self._size = self._size, 0
             return res
 
-        stack = []
-        data = self._data
+        nodes = [self]
+        for key in path[:-1]:
+            try:
+                nodes.append(nodes[-1]._children[key])
+            except KeyError:
+                return Paths()
+
         try:
-            for key in path:
-                stack.append(data)
-                data = data[key]
-            popped = data.pop(last_key)
+            res = nodes[-1]._children.pop(path[-1])
         except KeyError:
             return Paths()
+        self._remove(path[:-1], nodes, res._size)
+        return res
 
-        while not data and stack:
-            data = stack.pop()
-            del data[path[len(stack)]]
+    def prune(self, path, keys):
+        # Removes the subtrees of all children of path with the given keys,
+        # with a single lookup of path
+        if not self._size:
+            return
 
-        res = Paths()
-        res._data = popped
-        return res
+        nodes = [self]
+        for key in path:
+            try:
+                nodes.append(nodes[-1]._children[key])
+            except KeyError:
+                return
+
+        children = nodes[-1]._children
+        size = 0
+        for key in keys:
+            try:
+                size += children.pop(key)._size
+            except KeyError:
+                pass
+        if size:
+            self._remove(path, nodes, size)
+
+    def _remove(self, path, nodes, size):
+        # Updates the sizes of nodes along path after size paths have been
+        # removed below the last node, and drops nodes that became empty
+        for node in nodes:
+            node._size -= size
+        for index in range(len(nodes) - 1, 0, -1):
+            if nodes[index]._size:
+                break
+            del nodes[index - 1]._children[path[index - 1]]
+
+    def update(self, paths):
+        for path in paths:
+            self.add(path)
+
+    def clear(self):
+        self._children = {}
+        self._marked = False
+        self._size = 0
+
+    def subpaths(self):
+        yield from self._children.items()
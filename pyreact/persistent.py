@@ -0,0 +1,74 @@
+from collections.abc import Mapping
+from math import isqrt
+from types import MappingProxyType
+
+
+# Most dicts never get changes, so they share this empty overlay
+NO_CHANGES = MappingProxyType({})
+
+
+class PersistentDict(Mapping):
+
+    # An immutable mapping where setting a key returns a new mapping that
+    # shares the underlying dict with this one. The updated values are stored
+    # in an overlay that gets compacted into a new dict once it grows too large
+    # relative to the size of the mapping.
+
+    __slots__ = ('_base', '_changes')
+
+    def __init__(self, data=None):
+        # Takes ownership of data, so it should not be mutated afterwards
+        self._base = {} if data is None else data
+        self._changes = NO_CHANGES
+
+    def __getitem__(self, key):
+        try:
+            return self._changes[key]
+        except KeyError:
+            return self._base[key]
+
+    def __contains__(self, key):
+        return key in self._base
+
+    def __iter__(self):
+        return iter(self._base)
+
+    def __len__(self):
+        return len(self._base)
+
+    def items(self):
+        if not self._changes:
+            return self._base.items()
+        return self._iter_items()
+
+    def values(self):
+        if not self._changes:
+            return self._base.values()
+        return (value for _, value in self._iter_items())
+
+    def _iter_items(self):
+        changes = self._changes
+        for key, value in self._base.items():
+            yield key, changes.get(key, value)
+
+    def set(self, key, value):
+        if key not in self._base:
+            return PersistentDict({**dict(self.items()), key: value})
+
+        if self[key] is value:
+            return self
+
+        res = PersistentDict.__new__(PersistentDict)
+        changes = {**self._changes, key: value}
+
+        if len(changes) > max(8, isqrt(len(self._base))):
+            res._base = {
+                key: changes.get(key, value)
+                for key, value in self._base.items()
+            }
+            res._changes = NO_CHANGES
+        else:
+            res._base = self._base
+            res._changes = changes
+
+        return res
@@ -0,0 +1,82 @@
+from collections import Counter, OrderedDict
+from types import SimpleNamespace
+
+from .tracing import Tracer
+
+
+# Maximum number of paths to remember the stack of, when full the stack of
+# the least recently used path is dropped
+PATH_STACKS_SIZE = 10_000
+
+
+class Profiler(Tracer):
+
+    # Collects statistics per render function, pass it as tracer to render or
+    # App. Times are the time spent in the render functions themselves, not
+    # in rendering the nodes they return. dump writes these times per stack
+    # of components in the folded format that flamegraph.pl and speedscope
+    # read.
+
+    def __init__(self):
+        self.stats = {}
+        # Folded stack of the last component rendered at a path, to find the
+        # stacks of their descendants
+        self._path_stacks = OrderedDict()
+        self._stack_times = Counter()
+
+    def component_rendered(self, path, node, duration, ref_count, reason):
+        render_func = node._render_func
+        try:
+            stats = self.stats[render_func]
+        except KeyError:
+            stats = self.stats[render_func] = SimpleNamespace(
+                name=get_name(render_func),
+                calls=0,
+                mounts=0,
+                state_rerenders=0,
+                parent_rerenders=0,
+                total_time=0,
+                max_time=0,
+                ref_count=0,
+            )
+
+        stats.calls += 1
+        match reason:
+            case 'mount':
+                stats.mounts += 1
+            case 'state':
+                stats.state_rerenders += 1
+            case 'parent':
+                stats.parent_rerenders += 1
+        stats.total_time += duration
+        stats.max_time = max(stats.max_time, duration)
+        stats.ref_count = ref_count
+
+        stack = stats.name
+        for index in range(len(path) - 1, -1, -1):
+            try:
+                stack = f'{self._path_stacks[path[:index]]};{stack}'
+            except KeyError:
+                continue
+            self._path_stacks.move_to_end(path[:index])
+            break
+        self._path_stacks[path] = stack
+        self._path_stacks.move_to_end(path)
+        while len(self._path_stacks) > PATH_STACKS_SIZE:
+            self._path_stacks.popitem(last=False)
+        self._stack_times[stack] += duration
+
+    def dump(self, file):
+        # Writes a line with the stack and the time in microseconds for every
+        # stack of components that rendered
+        for stack, duration in self._stack_times.items():
+            file.write(f'{stack} {round(duration * 1_000_000)}\n')
+
+    def clear(self):
+        self.stats.clear()
+        self._path_stacks.clear()
+        self._stack_times.clear()
+
+
+def get_name(render_func):
+    return f'{render_func.__module__}.{render_func.__qualname__}'
@@ -1,4 +1,5 @@
 import asyncio
+from time import perf_counter
 from contextvars import ContextVar, copy_context
 from contextlib import contextmanager
 
@@ -11,11 +12,27 @@ CONTEXT = ContextVar('context')
 
 class Context:
 
-    def __init__(self):
+    def __init__(self, frame_time=0, snapshot=None, tracer=None):
         self.path = None
+        # Hook state to restore on the first render, see Context.snapshot
+        self.restore = snapshot
+        self.root = None
+        # Number of refs created, to detect if a component uses hooks
+        self.ref_count = 0
+        # Context for callbacks, see get_callback_context
+        self.callback_context = None
         self.next_ref = None
         self.rerender_paths = Paths()
         self.rerender_event = asyncio.Event()
+        self.flush_event = asyncio.Event()
+        self.frame_time = frame_time
+        self.next_frame = None
+        self.batch_depth = 0
+        # Updates of detached refs while there is no tree to apply them to,
+        # None when refs are not detached, see Context.detach
+        self.updates = None
+        # Receives render events, see Tracer
+        self.tracer = tracer
 
         token = CONTEXT.set(self)
         try:
@@ -31,10 +48,118 @@ class Context:
         finally:
             self.path = None
 
-    def rerender(self, path):
-        self.rerender_paths[path] = None
-        self.rerender_event.set()
+    def refs(self):
+        # Collects the refs of all components by their path, see snapshot and
+        # detach.
+        refs = {}
+        node, state, _ = self.root
+        node._collect_refs(state, (), refs)
+        return refs
+
+    def snapshot(self, refs=None):
+        # Collects the persistent values of all refs by the path of their
+        # component, rendering with this snapshot restores these values.
+        if refs is None:
+            refs = self.refs()
+        snapshot = {}
+        for path, component_refs in refs.items():
+            values = [
+                {key: getattr(ref, key) for key in getattr(ref, 'persistent', ())}
+                for ref in component_refs
+            ]
+            if any(values):
+                snapshot[path] = values
+        return snapshot
+
+    def detach(self, refs):
+        # Marks refs with their location before their tree is closed, so
+        # callbacks that still hold them update the refs at the same location
+        # once the tree is rendered again from a snapshot, see update_ref.
+        for path, component_refs in refs.items():
+            for index, ref in enumerate(component_refs):
+                ref.location = path, index
+        self.updates = []
+
+    def attach(self, snapshot):
+        # Returns snapshot with the updates of detached refs applied, see
+        # update_ref. Rendering from scratch covers all pending rerenders.
+        updates = self.updates
+        self.updates = None
+        self.rerender_paths = Paths()
         self.rerender_event.clear()
+        if not updates:
+            return snapshot
+
+        snapshot = {
+            path: [dict(values) for values in component_values]
+            for path, component_values in snapshot.items()
+        }
+        for (path, index), key, value in updates:
+            try:
+                values = snapshot[path][index]
+            except (KeyError, IndexError):
+                continue
+            if callable(value):
+                value = value(values.get(key))
+            values[key] = value
+        return snapshot
+
+    def update_ref(self, location, key, value):
+        # Sets key of the ref at location to value, or to the result of
+        # value called with the current value if it is callable. Until the
+        # tree is rendered again the update is kept for attach.
+        if self.updates is not None:
+            self.updates.append((location, key, value))
+            return
+
+        from .node.component import Component
+
+        path, index = location
+        node, state, result = self.root
+        try:
+            for path_key in path:
+                node, state, result = node._extract(state, result, path_key)
+        except KeyError:
+            return
+        if not isinstance(node, Component) or index >= len(state[0] or ()):
+            # The component was unmounted in the meantime
+            return
+
+        ref = state[0][index]
+        if callable(value):
+            value = value(getattr(ref, key))
+        setattr(ref, key, value)
+
+    def rerender(self, path):
+        self.rerender_paths.add(path)
+        if not self.batch_depth:
+            self.rerender_event.set()
+
+    async def wait_rerender(self):
+        # Waits until there are paths to rerender, all updates that happen
+        # until the next frame starts are combined into one render pass.
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self.rerender_event.wait()
+
+            delay = 0 if self.next_frame is None else self.next_frame - loop.time()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.flush_event.wait(), delay)
+                except TimeoutError:
+                    pass
+            elif not self.flush_event.is_set():
+                # Give other callbacks in this tick the chance to update
+                await asyncio.sleep(0)
+
+            self.rerender_event.clear()
+            self.flush_event.clear()
+
+            if self.rerender_paths and not self.batch_depth:
+                break
+
+        self.next_frame = loop.time() + self.frame_time
 
 
 @contextmanager
@@ -47,6 +172,29 @@ def push_context(key):
         context.path.pop()
 
 
+@contextmanager
+def batch():
+    context = CONTEXT.get()
+    context.batch_depth += 1
+    try:
+        yield
+    finally:
+        context.batch_depth -= 1
+        if not context.batch_depth and context.rerender_paths:
+            context.rerender_event.set()
+
+
+def flush_sync(func=None, /, *args, **kwargs):
+    context = CONTEXT.get()
+    try:
+        if func is not None:
+            return func(*args, **kwargs)
+    finally:
+        if context.rerender_paths and not context.batch_depth:
+            context.rerender_event.set()
+            context.flush_event.set()
+
+
 @contextmanager
 def set_next_ref(next_ref):
     context = CONTEXT.get()
@@ -58,43 +206,86 @@ def set_next_ref(next_ref):
         context.next_ref = None
 
 
-async def render(node):
+def tree_path(path):
+    return tuple(key for key in path if key != 'render')
+
+
+async def render(node, frame_time=0, context=None, tracer=None):
+    from .node.component import Component
+
     node = to_node(node)
-    context = Context()
+    if context is None:
+        context = Context(frame_time, tracer=tracer)
+    tracer = context.tracer
 
+    if tracer is not None:
+        tracer.render_start(None)
+        start = perf_counter()
     state, result = context.run([], node._render)
+    if tracer is not None:
+        tracer.render_end(perf_counter() - start, None)
+    context.restore = None
+    dirty = None
+
+    try:
+        while True:
+            context.root = node, state, result
+            yield result, dirty
+            await context.wait_rerender()
 
-    while True:
-        yield result
-        await context.rerender_event.wait()
+            stack = []
+            dirty = Paths()
+            if tracer is not None:
+                tracer.render_start(len(context.rerender_paths))
+                start = perf_counter()
 
-        stack = []
+            # Paths are taken ancestors first, so a component that is rendered
+            # again by a dirty ancestor removes its own path before we get to
+            # it, see Component._rerender. This is also how the component at
+            # path itself removes it. Paths of components that are unmounted
+            # along the way are removed as well. The order of siblings does
+            # not matter.
+            while context.rerender_paths:
+                path = context.rerender_paths.first()
 
-        for path in context.rerender_paths:
-            print('target', path)
+                common = 0
+                while (
+                    common < len(stack) and
+                    common < len(path) and
+                    stack[common][0] == path[common]
+                ):
+                    common += 1
 
-            while stack and (len(stack) > len(path) or stack[-1][0] != path[len(stack) - 1]):
-                key, node, pstate, presult = stack.pop()
-                print('pop', key)
-                print(node, pstate, presult)
-                state, result = node._inject(pstate, presult, key, state, result)
+                while len(stack) > common:
+                    key, node, pstate, presult = stack.pop()
+                    state, result = node._inject(pstate, presult, key, state, result)
 
-            for key in path[len(stack):]:
-                print('push', key)
-                print(node, state, result)
-                stack.append((key, node, state, result))
-                node, state, result = node._extract(state, result, key)
+                try:
+                    for key in path[len(stack):]:
+                        stack.append((key, node, state, result))
+                        node, state, result = node._extract(state, result, key)
+                except KeyError:
+                    _, node, state, result = stack.pop()
 
-            state, result = context.run(list(path), node._rerender, state, result)
+                if len(stack) < len(path) or not isinstance(node, Component):
+                    # The component was unmounted after it asked to render
+                    # again, for example by an event from a client that did not
+                    # have the latest patches yet
+                    context.rerender_paths.discard(path)
+                    continue
 
-        print('target', ())
+                dirty.cover(tree_path(path))
+                state, result = context.run(list(path), node._rerender, state, result)
 
-        while stack:
-            key, node, pstate, presult = stack.pop()
-            print('pop', key)
-            print(node, pstate, presult)
-            state, result = node._inject(pstate, presult, key, state, result)
+            while stack:
+                key, node, pstate, presult = stack.pop()
+                state, result = node._inject(pstate, presult, key, state, result)
 
-        print('done', ())
+            if tracer is not None:
+                tracer.render_end(perf_counter() - start, len(dirty))
 
-        context.rerender_paths.clear()
+    except (GeneratorExit, asyncio.CancelledError):
+        # Closing the generator unmounts the tree so cleanups of refs run
+        context.run([], node._unmount, state, result)
+        context.root = None
+        raise
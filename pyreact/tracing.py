@@ -0,0 +1,28 @@
+class Tracer:
+
+    # Receives events from rendering, pass an instance as tracer to render or
+    # App. All methods do nothing, so subclasses only implement the events
+    # they need. Without a tracer these events are not measured at all.
+
+    def render_start(self, path_count):
+        # A render pass starts for path_count components that have to render
+        # again, path_count is None for the first render
+        pass
+
+    def render_end(self, duration, dirty_count):
+        # A render pass took duration seconds and changed dirty_count
+        # subtrees, dirty_count is None for the first render
+        pass
+
+    def component_rendered(self, path, node, duration, ref_count, reason):
+        # The render function of the component at path took duration seconds,
+        # not counting the rendering of the nodes it returned, and used
+        # ref_count refs. The reason is 'mount' for the first render, 'state'
+        # if it rendered again because its own state changed and 'parent' if
+        # it rendered again because its parent did.
+        pass
+
+    def diff(self, action_count, duration):
+        # Diffing a render against the tree of the client took duration
+        # seconds and resulted in action_count actions
+        pass
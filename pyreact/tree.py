@@ -1,40 +1,91 @@
 import html
+from bisect import bisect_left
 from collections import namedtuple, Counter
 from collections.abc import Sequence
+from functools import lru_cache
+
+from .persistent import PersistentDict
 
 
 class Tree(Sequence):
 
-    def __init__(self, tag, props, children):
+    __slots__ = (
+        'tag',
+        'props',
+        'children',
+        '_start_tag',
+        '_html',
+        '_flat_children',
+        '_flat_indexes',
+    )
+
+    def __init__(self, tag, props, children, start_tag=None):
+        if not isinstance(children, PersistentDict):
+            children = PersistentDict(children)
         self.tag = tag
         self.props = props
         self.children = children
+        self._start_tag = start_tag
+        self._html = None
+        self._flat_children = None
+        self._flat_indexes = None
 
     def __str__(self):
-        return ''.join(to_html(self))
+        if self._html is not None:
+            return self._html
+        parts = []
+        write_html(self, parts.append)
+        return ''.join(parts)
 
     def __iter__(self):
-        for _, tree in merge_text(flatten_children(self.children)):
+        for _, tree in self.flat_children:
             yield tree
 
     def __getitem__(self, key):
         if isinstance(key, str):
             return self.props[key]
 
-        children = iter(self)
-        try:
-            for _ in range(key):
-                next(children)
-            tree = next(children)
-        except StopIteration:
-            raise IndexError() from None
+        if key < 0:
+            raise IndexError()
+        _, tree = self.flat_children[key]
         return tree
 
     def __len__(self):
-        res = 0
-        for _ in self:
-            res += 1
-        return res
+        return len(self.flat_children)
+
+    # Trees are never modified after construction, so the flattened children
+    # can be computed once and reused for iteration, indexing and diffing.
+
+    @property
+    def flat_children(self):
+        if self._flat_children is None:
+            self._flat_children = tuple(merge_text(flatten_children(self.children)))
+        return self._flat_children
+
+    @property
+    def flat_indexes(self):
+        if self._flat_indexes is None:
+            self._flat_indexes = {
+                key: index
+                for index, (key, _) in enumerate(self.flat_children)
+            }
+        return self._flat_indexes
+
+    @property
+    def start_tag(self):
+        if self._start_tag is None:
+            self._start_tag = get_start_tag(self.tag, self.props)
+        return self._start_tag
+
+    def cache_html(self):
+        # For trees that are serialized often, like results of static
+        # components
+        self._html = str(self)
+
+    def with_children(self, children):
+        # Creates a tree with the same tag and props, which means we can reuse
+        # the serialized start tag
+        return Tree(self.tag, self.props, children, self._start_tag)
 
 
 SELF_CLOSING = {
@@ -55,38 +106,115 @@ SELF_CLOSING = {
 }
 
 
-def to_html(tree):
+# Number of escaped strings to remember, text and attribute values tend to
+# repeat a lot within and between renders
+ESCAPE_CACHE_SIZE = 4096
+
+
+def write_html(tree, append):
+    # Serializes the tree by calling append with every part
     if isinstance(tree, str):
-        yield html.escape(tree, quote=False)
+        append(escape_text(tree))
         return
 
-    if tree.tag is None:
-        assert not tree.props
-        for child in tree.children.values():
-            yield from to_html(child)
+    if tree._html is not None:
+        append(tree._html)
         return
 
-    yield '<'
-    yield tree.tag
+    if tree.tag is not None:
+        append(tree.start_tag)
+        if tree.tag in SELF_CLOSING:
+            assert not tree.children
+            return
+    else:
+        assert not tree.props
+
+    for child in tree.children.values():
+        if isinstance(child, str):
+            append(escape_text(child))
+        else:
+            write_html(child, append)
+
+    if tree.tag is not None:
+        append(get_end_tag(tree.tag))
+
+
+def to_html(tree, chunk_size=None):
+    # Serializes the tree into chunks of at least chunk_size characters, or a
+    # single chunk if chunk_size is None. Uses a stack instead of recursion so
+    # we can yield in between.
+    parts = []
+    append = parts.append
+    size = 0
+    stack = [(iter((tree,)), None)]
+
+    while stack:
+        children, end_tag = stack[-1]
+
+        for child in children:
+            if isinstance(child, str):
+                part = escape_text(child)
+            elif child._html is not None:
+                part = child._html
+            elif child.tag is None:
+                assert not child.props
+                stack.append((iter(child.children.values()), None))
+                break
+            elif child.tag in SELF_CLOSING:
+                assert not child.children
+                part = child.start_tag
+            else:
+                part = child.start_tag
+                append(part)
+                size += len(part)
+                stack.append((iter(child.children.values()), get_end_tag(child.tag)))
+                break
+            append(part)
+            size += len(part)
+        else:
+            stack.pop()
+            if end_tag is not None:
+                append(end_tag)
+                size += len(end_tag)
+
+        if chunk_size is not None and size >= chunk_size:
+            yield ''.join(parts)
+            parts.clear()
+            size = 0
+
+    if parts or chunk_size is None:
+        yield ''.join(parts)
+
 
-    for key, value in clean_props(tree.props).items():
-        yield ' '
-        yield key
+def get_start_tag(tag, props):
+    # Same as clean_props but without building the intermediate dict
+    start_tag = '<' + tag
+
+    for key, value in props.items():
+        if key == 'key' or value is False:
+            continue
+        value = '' if value is True else str(value)
         if value:
-            yield '="'
-            yield html.escape(value)
-            yield '"'
+            start_tag += f' {key}="{escape_attribute(value)}"'
+        else:
+            start_tag += ' ' + key
 
-    if tree.tag in SELF_CLOSING:
-        assert not tree.children
-        yield ' />'
-    else:
-        yield '>'
-        for child in tree.children.values():
-            yield from to_html(child)
-        yield '</'
-        yield tree.tag
-        yield '>'
+    return start_tag + (' />' if tag in SELF_CLOSING else '>')
+
+
+@lru_cache(maxsize=None)
+def get_end_tag(tag):
+    return f'</{tag}>'
+
+
+@lru_cache(maxsize=ESCAPE_CACHE_SIZE)
+def escape_text(text):
+    return html.escape(text, quote=False)
+
+
+@lru_cache(maxsize=ESCAPE_CACHE_SIZE)
+def escape_attribute(value):
+    return html.escape(value)
 
 
 def clean_props(props):
@@ -102,6 +230,15 @@ def clean_props(props):
     return cleaned
 
 
+def clean_value(value):
+    # The value of a prop as it is sent to the client, None if it is not set
+    if value is False:
+        return None
+    elif value is True:
+        return ''
+    return str(value)
+
+
 def flatten_children(children, path=()):
     for key, child in children.items():
         if isinstance(child, str) or child.tag is not None:
@@ -133,79 +270,281 @@ def merge_text(children):
     yield from clear_text()
 
 
-def diff(old_tree, new_tree):
-    return diff_children((), {(): old_tree}, {(): new_tree})
+def diff(old_tree, new_tree, dirty=None):
+    old_root = Tree(None, {}, {(): old_tree})
+    new_root = Tree(None, {}, {(): new_tree})
+    if dirty is None:
+        return diff_children((), old_root, new_root)
+    else:
+        return diff_dirty_children((), old_root, new_root, [((), dirty)])
+
+
+def diff_dirty_children(path, old_tree, new_tree, subpaths):
+    if old_tree.children is new_tree.children:
+        return
+
+    # Diff children where all changes are contained in the subtrees at the
+    # dirty paths. Outside of these subtrees the children only differ in the
+    # dirty keys, so as long as the dirty subtrees do not change shape we can
+    # leave the other children alone.
+    targets = []
+    if not collect_dirty(old_tree.children, new_tree.children, subpaths, (), targets):
+        yield from diff_children(path, old_tree, new_tree)
+        return
+
+    indexes = new_tree.flat_indexes
+    for key, old_child, new_child, dirty in targets:
+        subpath = (*path, indexes[key])
+        yield from diff_props(subpath, old_child, new_child)
+        if () in dirty:
+            yield from diff_children(subpath, old_child, new_child)
+        else:
+            yield from diff_dirty_children(subpath, old_child, new_child, dirty.subpaths())
+
+
+def collect_dirty(old_children, new_children, subpaths, prefix, targets):
+    for key, dirty in subpaths:
+        try:
+            old_child = old_children[key]
+            new_child = new_children[key]
+        except KeyError:
+            return False
+
+        if old_child is new_child:
+            continue
+
+        if (
+            isinstance(old_child, str) or
+            isinstance(new_child, str) or
+            old_child.tag != new_child.tag
+        ):
+            return False
+
+        if new_child.tag is not None:
+            targets.append(((*prefix, *key), old_child, new_child, dirty))
+        elif () in dirty or not collect_dirty(
+            old_child.children, new_child.children, dirty.subpaths(), (*prefix, *key), targets,
+        ):
+            return False
+
+    return True
 
 
-def diff_children(path, old_children, new_children):
-    old_children = list(merge_text(flatten_children(old_children)))
-    new_children = list(merge_text(flatten_children(new_children)))
-    new_children_by_key = dict(new_children)
+# When more than this fraction of the matched children has to move we send the
+# complete new order in one action instead of a move per child
+ORDER_RATIO = 4
+ORDER_MIN = 8
 
-    old_i = 0
-    deletes = 0
+
+def diff_children(path, old_tree, new_tree):
+    if old_tree.children is new_tree.children:
+        return
+
+    old_children = old_tree.flat_children
+    new_children = new_tree.flat_children
+    old_indexes = old_tree.flat_indexes
+
+    # Match new children with old children that have the same key
+    matches = [None] * len(new_children)
+    matched = [False] * len(old_children)
 
     for new_i, (key, new_child) in enumerate(new_children):
-        # First get rid of nodes that are at the current position that we will
-        # not use for diffing
-        while old_i < len(old_children):
-            key_, old_child = old_children[old_i]
-            try:
-                diffable = is_diffable(old_child, new_children_by_key[key_])
-            except KeyError:
-                diffable = False
-                
-            if diffable:
-                break
+        old_i = old_indexes.get(key)
+        if old_i is not None and is_diffable(old_children[old_i][1], new_child):
+            matches[new_i] = old_i
+            matched[old_i] = True
+
+    # Pair up the remaining children that are between the same matched
+    # children so we can replace them instead of deleting and creating
+    unmatched = {}
+    prev_i = None
+    for old_i, is_matched in enumerate(matched):
+        if is_matched:
+            prev_i = old_i
+        else:
+            unmatched.setdefault(prev_i, []).append(old_i)
+    for old_indexes_ in unmatched.values():
+        old_indexes_.reverse()
+
+    replaces = set()
+    prev_i = None
+    for new_i, old_i in enumerate(matches):
+        if old_i is not None:
+            prev_i = old_i
+            continue
+        try:
+            old_i = unmatched[prev_i].pop()
+        except (KeyError, IndexError):
+            continue
+        matches[new_i] = old_i
+        matched[old_i] = True
+        replaces.add(new_i)
+
+    # Delete all old children that are not used, from back to front so the
+    # indexes stay valid
+    for old_i in reversed(range(len(old_children))):
+        if not matched[old_i]:
+            yield ('delete', *path, old_i)
+
+    # After the deletes every remaining old child is at its rank
+    ranks = {}
+    for old_i, is_matched in enumerate(matched):
+        if is_matched:
+            ranks[old_i] = len(ranks)
+    sequence = [
+        None if old_i is None else ranks[old_i]
+        for old_i in matches
+    ]
+
+    # The children in the longest increasing subsequence of ranks can stay
+    # where they are, all other children have to move
+    stay = longest_increasing_subsequence(sequence)
+    moves = len(ranks) - len(stay)
+
+    if moves >= ORDER_MIN and moves * ORDER_RATIO > len(ranks):
+        yield ('order', *path, [rank for rank in sequence if rank is not None])
+        for new_i, rank in enumerate(sequence):
+            if rank is None:
+                yield ('create', *path, new_i, to_node(new_children[new_i][1]))
+    elif moves or len(ranks) < len(new_children):
+        yield from place_children(path, new_children, sequence, stay)
+
+    # Now that every child is at its new index we can diff the children
+    for new_i, old_i in enumerate(matches):
+        if old_i is None:
+            continue
+        _, old_child = old_children[old_i]
+        _, new_child = new_children[new_i]
+        if new_i in replaces:
+            yield ('replace', *path, new_i, to_node(new_child))
+        elif not isinstance(new_child, str) and old_child is not new_child:
+            yield from diff_props((*path, new_i), old_child, new_child)
+            yield from diff_children((*path, new_i), old_child, new_child)
+
+
+def place_children(path, new_children, sequence, stay):
+    # Places the children from back to front by moving or creating every child
+    # that does not stay right before the child that comes after it. At any
+    # point the current children consist of the children that stay and the
+    # children that still have to move in their old order, where each child
+    # that is already placed is right before the next child that stays. This
+    # allows us to calculate indexes using a fenwick tree of ranks for the
+    # children that did not move yet and one of new indexes for the children
+    # that are placed.
+    size = len(sequence) - sequence.count(None)
+    unplaced = FenwickTree(size, 1)
+    placed = FenwickTree(len(sequence), 0)
+
+    # For each new index the rank of the first child at or after it that stays
+    next_stay = [size] * (len(sequence) + 1)
+    for new_i in reversed(range(len(sequence))):
+        next_stay[new_i] = sequence[new_i] if new_i in stay else next_stay[new_i + 1]
+
+    # For each rank the new index of the last child before it that stays
+    stay_ranks = {sequence[new_i]: new_i for new_i in stay}
+    prev_stay = [0] * size
+    stay_i = 0
+    for rank in range(size):
+        prev_stay[rank] = stay_i
+        if rank in stay_ranks:
+            stay_i = stay_ranks[rank]
+
+    for new_i in reversed(range(len(sequence))):
+        if new_i in stay:
+            continue
 
-            deletes += 1
-            old_i += 1
+        rank = sequence[new_i]
+        if rank is not None:
+            from_i = unplaced.sum(rank) + placed.sum(prev_stay[rank])
+            unplaced.add(rank, -1)
+        to_i = unplaced.sum(next_stay[new_i])
+        placed.add(new_i, 1)
 
-        # Then check if we can find a node to diff with
-        for cur_i in range(old_i, len(old_children)):
-            key_, old_child = old_children[cur_i]
-            if key_ == key:
-                diffable = is_diffable(old_child, new_child)
-                break
+        if rank is None:
+            yield ('create', *path, to_i, to_node(new_children[new_i][1]))
+        elif from_i != to_i:
+            yield ('move', *path, from_i, to_i)
+
+
+def longest_increasing_subsequence(sequence):
+    # Patience sorting, tails[i] is the index of the smallest value that ends
+    # an increasing subsequence of length i + 1
+    tails = []
+    tail_values = []
+    prevs = {}
+
+    for index, value in enumerate(sequence):
+        if value is None:
+            continue
+        i = bisect_left(tail_values, value)
+        prevs[index] = tails[i - 1] if i else None
+        if i == len(tails):
+            tails.append(index)
+            tail_values.append(value)
         else:
-            diffable = False
+            tails[i] = index
+            tail_values[i] = value
 
-        # Check if we can diff with node, otherwise just create
-        if not diffable:
-            if deletes:
-                action = 'replace'
-                deletes -= 1
-            else:
-                action = 'create'
+    indexes = set()
+    index = tails[-1] if tails else None
+    while index is not None:
+        indexes.add(index)
+        index = prevs[index]
+
+    return indexes
+
+
+class FenwickTree:
 
-            yield (action, *path, new_i, to_node(new_child))
+    def __init__(self, size, value):
+        self._data = [0] * (size + 1)
+        for i in range(1, size + 1):
+            self._data[i] += value
+            parent = i + (i & -i)
+            if parent <= size:
+                self._data[parent] += self._data[i]
+
+    def add(self, index, value):
+        index += 1
+        while index < len(self._data):
+            self._data[index] += value
+            index += index & -index
+
+    def sum(self, end):
+        # Sum of the values at indexes before end
+        res = 0
+        while end > 0:
+            res += self._data[end]
+            end -= end & -end
+        return res
+
+
+def diff_props(path, old_tree, new_tree):
+    if old_tree.props is new_tree.props:
+        return
+
+    # Compare the values before serializing them, so values that are reused
+    # between renders, like callbacks, are never converted to strings
+    old_props = old_tree.props
+    new_props = new_tree.props
+
+    for key, new_value in new_props.items():
+        if key == 'key':
+            continue
+        old_value = old_props.get(key, False)
+        if new_value is old_value:
             continue
+        new_value = clean_value(new_value)
+        old_value = clean_value(old_value)
+        if new_value is None:
+            if old_value is not None:
+                yield ('unset', *path, key)
+        elif new_value != old_value:
+            yield ('set', *path, key, new_value)
 
-        # Handle deletes so we can diff
-        while deletes:
-            yield ('delete', *path, new_i)
-            deletes -= 1
-
-        # Check if we have to move the node to the current position first
-        if cur_i > old_i:
-            yield ('move', *path, new_i + (cur_i - old_i), new_i)
-            old_children.insert(old_i, old_children.pop(cur_i))
-
-        # Diff the nodes if they are trees
-        if not isinstance(new_child, str) and old_child is not new_child:
-            old_props = clean_props(old_child.props)
-            for key, new_value in clean_props(new_child.props).items():
-                if new_value != old_props.pop(key, None):
-                    yield ('set', *path, new_i, key, new_value)
-            for key in old_props:
-                yield ('unset', *path, new_i, key)
-            yield from diff_children((*path, new_i), old_child.children, new_child.children)
-
-        old_i += 1
-           
-    # Delete all remaining old nodes
-    for _ in range(deletes + len(old_children) - old_i):
-        yield ('delete', *path, len(new_children))
+    for key, old_value in old_props.items():
+        if key != 'key' and key not in new_props and clean_value(old_value) is not None:
+            yield ('unset', *path, key)
 
 
 def to_node(tree):
@@ -215,7 +554,7 @@ def to_node(tree):
         return (
             tree.tag,
             clean_props(tree.props),
-            *map(to_node, tree.children.values()),
+            *map(to_node, tree),
         )
 
     
@@ -1,5 +1,7 @@
 from .app import App
-from .session import get_url, push_url, replace_url, use_url, link
+from .session import get_url, get_stats, push_url, replace_url, use_url, link
+from .store import SessionStore, MemoryStore, FileStore
+from .cache import PageCache
 
 
 __all__ = ['App']
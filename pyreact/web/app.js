@@ -2,8 +2,25 @@ const HTTP_TO_WS = { 'http:': 'ws:', 'https:': 'wss:' };
 
 const [, session_id] = /[?&]session=(.*)(?:&|$)/.exec(document.currentScript.src);
 const socket = new WebSocket(`${HTTP_TO_WS[window.location.protocol]}//${window.location.host}/${session_id}`);
+socket.binaryType = 'arraybuffer';
 const root = createTree(document);
 
+// Number of arguments after the path per action, compact and binary messages
+// refer to actions by their index in this list.
+const ACTIONS = [
+    ['create', 2],
+    ['delete', 1],
+    ['replace', 2],
+    ['move', 2],
+    ['order', 1],
+    ['set', 2],
+    ['unset', 1],
+    ['push_url', 1],
+    ['replace_url', 1],
+];
+const strings = [];
+const textDecoder = new TextDecoder();
+
 function createTree(node) {
     if (node.value !== undefined) {
         node.value = node.getAttribute('value') ?? '';
@@ -82,8 +99,142 @@ function handle(event, preventDefault, stopPropagation) {
     socket.send(JSON.stringify([event.type, ...path, details]));
 }
 
+function intern(value) {
+    if (typeof value === 'number') {
+        return strings[value];
+    }
+    strings.push(value);
+    return value;
+}
+
+function expandNode(node) {
+    if (typeof node === 'string') {
+        return node;
+    }
+
+    const [tag, flatProps, ...children] = node;
+    const expandedTag = intern(tag);
+    const props = {};
+    for (let i = 0; i < flatProps.length; i += 2) {
+        props[intern(flatProps[i])] = flatProps[i + 1];
+    }
+    return [expandedTag, props, ...children.map(expandNode)];
+}
+
+function expandActions(compactActions) {
+    const actions = [];
+    let path = [];
+
+    for (const [opcode, shared, ...rest] of compactActions) {
+        const [action, arity] = ACTIONS[opcode];
+        const args = rest.splice(rest.length - arity, arity);
+        path = [...path.slice(0, shared), ...rest];
+
+        switch (action) {
+            case 'create':
+            case 'replace':
+                args[1] = expandNode(args[1]);
+                break;
+
+            case 'set':
+            case 'unset':
+                args[0] = intern(args[0]);
+                break;
+        }
+
+        actions.push([action, ...path, ...args]);
+    }
+
+    return actions;
+}
+
+function unpack(bytes) {
+    let offset = 0;
+
+    function varint() {
+        let value = 0;
+        let scale = 1;
+        let byte;
+        do {
+            byte = bytes[offset++];
+            value += (byte & 0x7f) * scale;
+            scale *= 0x80;
+        } while (byte & 0x80);
+        return value;
+    }
+
+    function next() {
+        const header = varint();
+        const size = Math.floor(header / 4);
+        switch (header % 4) {
+            case 0:
+                return size;
+
+            case 1: {
+                const value = textDecoder.decode(bytes.subarray(offset, offset + size));
+                offset += size;
+                return value;
+            }
+
+            case 2: {
+                const value = [];
+                for (let i = 0; i < size; i++) {
+                    value.push(next());
+                }
+                return value;
+            }
+        }
+    }
+
+    return next();
+}
+
+async function inflate(bytes) {
+    const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+    return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+function decodeText(text) {
+    const actions = JSON.parse(text);
+    if (actions.length > 0 && typeof actions[0][0] === 'number') {
+        return expandActions(actions);
+    }
+    return actions;
+}
+
+async function decode(data) {
+    if (!(data instanceof ArrayBuffer)) {
+        return decodeText(data);
+    }
+
+    let bytes = new Uint8Array(data);
+
+    // Compressed frames start with a header byte with type 3, the rest of the
+    // header says if the compressed payload is text or binary.
+    if ((bytes[0] & 3) === 3) {
+        const kind = bytes[0] >> 2;
+        bytes = await inflate(bytes.subarray(1));
+        if (kind === 0) {
+            return decodeText(textDecoder.decode(bytes));
+        }
+    }
+
+    return expandActions(unpack(bytes));
+}
+
+// Decoding can be asynchronous, so chain the messages to apply them in order.
+// Every message handles its own errors, so one failing message does not stop
+// the messages after it.
+let messages = Promise.resolve();
+
 socket.addEventListener('message', function (event) {
-    for (const [action, ...path] of JSON.parse(event.data)) {
+    messages = messages
+        .then(async () => applyActions(await decode(event.data)))
+        .catch((error) => console.error(error));
+});
+
+function applyActions(actions) {
+    for (const [action, ...path] of actions) {
         switch (action) {
             case 'create': {
                 const node = createNode(path.pop());
@@ -108,6 +259,25 @@ socket.addEventListener('message', function (event) {
                 tree.children[index] = createTree(node);
             }; break;
 
+            case 'move': {
+                const to = path.pop();
+                const from = path.pop();
+                const tree = getTree(path);
+                const [child] = tree.children.splice(from, 1);
+                tree.node.insertBefore(child.node, tree.children[to]?.node ?? null);
+                tree.children.splice(to, 0, child);
+            }; break;
+
+            case 'order': {
+                const order = path.pop();
+                const tree = getTree(path);
+                const children = order.map((index) => tree.children[index]);
+                for (const child of children) {
+                    tree.node.appendChild(child.node);
+                }
+                tree.children = children;
+            }; break;
+
             case 'set': {
                 const value = path.pop();
                 const key = path.pop();
@@ -143,7 +313,7 @@ socket.addEventListener('message', function (event) {
                 throw new Error(`unknown action: ${action}`);
         }
     }
-});
+}
 
 addEventListener('popstate', () => {
     socket.send(JSON.stringify(['pop_url', window.location.pathname]));
@@ -1,52 +1,160 @@
 import asyncio
 import json
+from time import perf_counter
 from uuid import uuid4
 from pathlib import Path
 from mimetypes import guess_type
 from types import SimpleNamespace
 
 from ..node import to_node
-from ..tree import Tree, diff
+from ..tree import Tree, diff, to_html
+from .encoding import ENCODERS, compress
 from .render import render
 from .session import Session, SESSION
+from .store import PendingSessions, MemoryStore
+from .cache import PageCache
+from .workers import WorkerRouter
 
 
 SCRIPT_PATH = Path(__file__).parent / 'app.js'
 CHUNK_SIZE = 4096
+SESSION_TTL = 60
+MAX_SESSIONS = 1000
 
 
 class App:
 
-    def __init__(self, node):
+    def __init__(
+        self,
+        node,
+        frame_time=0,
+        max_message_rate=None,
+        min_batch_latency=0,
+        encoding='plain',
+        compress_threshold=None,
+        chunk_size=CHUNK_SIZE,
+        session_ttl=SESSION_TTL,
+        max_sessions=MAX_SESSIONS,
+        idle_timeout=None,
+        session_store=None,
+        worker_dir=None,
+        page_cache=None,
+        lazy_sessions=False,
+        tracer=None,
+    ):
         self._node = to_node(node)
-        self._sessions = {}
+        # Sessions waiting for their websocket to connect
+        self._sessions = PendingSessions(session_ttl, max_sessions)
+        self._frame_time = frame_time
+        self._min_message_interval = 0 if max_message_rate is None else 1 / max_message_rate
+        self._min_batch_latency = min_batch_latency
+        self._encoder_class = ENCODERS[encoding]
+        self._compress_threshold = compress_threshold
+        self._chunk_size = chunk_size
+        # Connected sessions that have been idle for idle_timeout seconds are
+        # stored as a snapshot of their state in session_store and rendered
+        # again from that snapshot on the next event.
+        self._idle_timeout = idle_timeout
+        if session_store is None and idle_timeout is not None:
+            session_store = MemoryStore()
+        self._session_store = session_store
+        # Set worker_dir when running in multiple processes, websockets are
+        # then forwarded to the process that rendered their session.
+        self._router = None if worker_dir is None else WorkerRouter(worker_dir)
+        # With a page cache the first render of a url is shared by all
+        # requests for it, sessions are then only created when the websocket
+        # connects.
+        if page_cache is True:
+            page_cache = PageCache()
+        self._page_cache = page_cache
+        # Lazy sessions do not keep their state after the first render, they
+        # are rendered again when the websocket connects. This assumes that
+        # the first render of a url is always the same.
+        self._lazy_sessions = lazy_sessions
+        # Receives render and diff events of all sessions, see Tracer
+        self._tracer = tracer
 
     async def __call__(self, scope, receive, send):
         return await getattr(self, scope['type'])(scope, receive, send)
 
+    async def lifespan(self, scope, receive, send):
+        while True:
+            message = await receive()
+            match message['type']:
+                case 'lifespan.startup':
+                    if self._router is not None:
+                        await self._router.start(self.websocket)
+                    await send({'type': 'lifespan.startup.complete'})
+                case 'lifespan.shutdown':
+                    if self._router is not None:
+                        await self._router.aclose()
+                    await self._sessions.aclose()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+
     async def http(self, scope, receive, send):
         if scope['path'] == '/_pyreact.js':
             return await self.http_file(scope, receive, send, SCRIPT_PATH)
 
-        session = Session(scope)
-        token = SESSION.set(session)
-        try:
-            trees = render(self._node, session.id)
-            tree = await anext(trees)
-        finally:
-            SESSION.reset(token)
+        if self._router is not None:
+            await self._router.start(self.websocket)
+
+        if self._page_cache is not None and scope.get('method', 'GET') == 'GET':
+            return await self.http_page(scope, receive, send)
 
-        self._sessions[session.id] = session, tree, trees
+        session = Session(scope, self._new_session_id())
+        tree, trees = await self._render(session)
+        if self._lazy_sessions:
+            await trees.aclose()
+            self._sessions.add(session, None, None)
+        else:
+            self._sessions.add(session, tree, trees)
 
         await send({
             'type': 'http.response.start',
             'status': 200,
             'headers': [(b'content-type', b'text/html; charset=utf-8')],
         })
+        # Stream the html while it is serialized so the browser can start on
+        # the head before the whole body is done
+        body = '<!doctype html>'
+        for chunk in to_html(tree, self._chunk_size):
+            if len(body) < self._chunk_size:
+                body += chunk
+                continue
+            await send({
+                'type': 'http.response.body',
+                'body': body.encode(),
+                'more_body': True,
+            })
+            body = chunk
         await send({
             'type': 'http.response.body',
-            'body': f'<!doctype html>{tree}'.encode(),
+            'body': body.encode(),
+            'more_body': False,
+        })
+
+    async def http_page(self, scope, receive, send):
+        page = self._page_cache.get(scope['path'])
+        if page is None:
+            session = Session(scope, self._new_session_id())
+            tree, trees = await self._render(session)
+            await trees.aclose()
+            html = ('<!doctype html>' + str(tree)).encode()
+            page = self._page_cache.add(session.id, scope['path'], tree, html)
+
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [(b'content-type', b'text/html; charset=utf-8')],
         })
+        for start in range(0, len(page.html), self._chunk_size):
+            end = start + self._chunk_size
+            await send({
+                'type': 'http.response.body',
+                'body': page.html[start:end],
+                'more_body': end < len(page.html),
+            })
 
     async def http_file(self, scope, receive, send, path):
         if not path.is_file():
@@ -77,8 +185,8 @@ class App:
         with path.open('rb') as f:
             more_body = True
             while more_body:
-                chunk = f.read(CHUNK_SIZE)
-                more_body = len(chunk) == CHUNK_SIZE
+                chunk = f.read(self._chunk_size)
+                more_body = len(chunk) == self._chunk_size
                 await send({
                     'type': 'http.response.body',
                     'body': chunk,
@@ -86,34 +194,112 @@ class App:
                 })
 
     async def websocket(self, scope, receive, send):
+        session_id = scope['path'][1:]
+
+        if self._router is not None:
+            await self._router.start(self.websocket)
+            owner = self._router.get_owner(session_id)
+            if owner is not None and owner != self._router.id:
+                return await self._router.forward(owner, scope, receive, send)
+
         assert (await receive())['type'] == 'websocket.connect'
 
-        session_id = scope['path'][1:]
+        actions = []
         try:
             session, node, nodes = self._sessions.pop(session_id)
         except KeyError:
-            await send({'type': 'websocket.close'})
-            return
+            if self._page_cache is None:
+                page = None
+            else:
+                page = self._page_cache.get_page(session_id)
+            if page is None:
+                await send({'type': 'websocket.close'})
+                return
+
+            # The client has the cached page, so the first render of the new
+            # session is sent as a diff against that
+            session = Session({'path': page.url}, self._new_session_id(), page.id)
+            node, nodes = await self._render(session)
+            actions.extend(self._diff(page.tree, node))
+
+        if nodes is None:
+            # Lazy sessions are rendered again now that they are used
+            node, nodes = await self._render(session)
 
         await send({'type': 'websocket.accept'})
-            
+
+        loop = asyncio.get_running_loop()
+        encoder = self._encoder_class()
+
         receive_fut = asyncio.create_task(receive())
         actions_fut = asyncio.create_task(session.actions_event.wait())
         node_fut = asyncio.create_task(anext(nodes))
+        # Wake up right away if there already are actions to send
+        flush_fut = asyncio.create_task(asyncio.sleep(0)) if actions else None
+
+        # Changes are collected until the flush policy allows us to send them,
+        # the tree is then diffed against the tree the client has, so patches
+        # that cancel each other out are never sent.
+        new_node = None
+        dirty = None
+        pending_since = None
+        last_send = None
+        last_activity = loop.time()
+        # While the session is stored, state updates from callbacks that still
+        # run wake it up
+        wake_fut = None
 
         try:
             while True:
-                await asyncio.wait(
-                    {receive_fut, actions_fut, node_fut},
+                futs = {receive_fut, actions_fut}
+                if node_fut is not None:
+                    futs.add(node_fut)
+                if flush_fut is not None:
+                    futs.add(flush_fut)
+                if wake_fut is not None:
+                    futs.add(wake_fut)
+
+                timeout = None
+                if (
+                    self._idle_timeout is not None and
+                    nodes is not None and
+                    not actions and
+                    new_node is None
+                ):
+                    timeout = max(last_activity + self._idle_timeout - loop.time(), 0)
+
+                done, _ = await asyncio.wait(
+                    futs,
+                    timeout=timeout,
                     return_when=asyncio.FIRST_COMPLETED,
                 )
 
+                if not done:
+                    if await self._store_session(session, nodes, node_fut):
+                        node, nodes, node_fut = None, None, None
+                        wake_fut = asyncio.create_task(session.context.rerender_event.wait())
+                    last_activity = loop.time()
+                    continue
+
+                if nodes is None and (wake_fut.done() or (
+                    receive_fut.done() and
+                    receive_fut.result()['type'] == 'websocket.receive'
+                )):
+                    wake_fut.cancel()
+                    wake_fut = None
+                    node, new_node, nodes = await self._load_session(session)
+                    dirty = None
+                    node_fut = asyncio.create_task(anext(nodes))
+                    last_activity = loop.time()
+
                 if receive_fut.done():
                     message = receive_fut.result()
                     if message['type'] == 'websocket.disconnect':
                         break
 
                     assert message['type'] == 'websocket.receive'
+                    last_activity = loop.time()
+
                     event_type, *path, data = json.loads(
                         message.get('bytes') or
                         message.get('text') or
@@ -129,29 +315,150 @@ class App:
                             target = target[index]
                         handler = target.props[f'on{event_type}']
                         event = SimpleNamespace(type=event_type, **data)
-                        asyncio.get_running_loop().call_soon(handler, event)
+                        loop.call_soon(handler, event)
 
                     receive_fut = asyncio.create_task(receive())
 
-                actions = []
-
                 if actions_fut.done():
                     actions.extend(session.actions)
                     session.actions.clear()
                     actions_fut = asyncio.create_task(session.actions_event.wait())
 
-                if node_fut.done():
-                    new_node = node_fut.result()
-                    actions.extend(diff(node, new_node))
-                    node = new_node
+                if node_fut is not None and node_fut.done():
+                    last_activity = loop.time()
+                    next_node, next_dirty = node_fut.result()
+                    if new_node is None:
+                        dirty = next_dirty
+                    elif dirty is not None and next_dirty is not None:
+                        dirty.update(next_dirty)
+                    else:
+                        dirty = None
+                    new_node = next_node
                     node_fut = asyncio.create_task(anext(nodes))
 
+                if flush_fut is not None and flush_fut.done():
+                    flush_fut = None
+
+                if not actions and new_node is None:
+                    continue
+
+                now = loop.time()
+                if pending_since is None:
+                    pending_since = now
+
+                flush_at = pending_since + self._min_batch_latency
+                if last_send is not None:
+                    flush_at = max(flush_at, last_send + self._min_message_interval)
+
+                if now < flush_at:
+                    if flush_fut is None:
+                        flush_fut = asyncio.create_task(asyncio.sleep(flush_at - now))
+                    continue
+
+                if new_node is not None:
+                    actions.extend(self._diff(node, new_node, dirty))
+                    node = new_node
+                    new_node = None
+                    dirty = None
+
+                pending_since = None
+
                 if actions:
-                    await send({
-                        'type': 'websocket.send',
-                        'text': json.dumps(actions, separators=(',', ':')),
-                    })
+                    message, raw_size, sent_size = compress(
+                        encoder.encode(actions),
+                        self._compress_threshold,
+                    )
+                    session.stats.messages += 1
+                    session.stats.raw_bytes += raw_size
+                    session.stats.sent_bytes += sent_size
+
+                    await send({'type': 'websocket.send', **message})
+                    actions = []
+                    last_send = loop.time()
 
         finally:
             receive_fut.cancel()
-            node_fut.cancel()
+            actions_fut.cancel()
+            if flush_fut is not None:
+                flush_fut.cancel()
+            if wake_fut is not None:
+                wake_fut.cancel()
+            if nodes is None:
+                await self._session_store.delete(session.id)
+            else:
+                # The generator can only be closed once the pending render is
+                # cancelled, closing it unmounts the tree
+                node_fut.cancel()
+                await asyncio.wait({node_fut})
+                await nodes.aclose()
+
+    async def _store_session(self, session, nodes, node_fut):
+        # Replaces the render generator of an idle session by a snapshot of
+        # its state, returns if the session was stored. The tree the client
+        # has is rendered again from the snapshot, so this assumes that
+        # components render the same output for the same state.
+        context = session.context
+        if context.rerender_paths:
+            # A render is pending, so the client does not have this state yet
+            return False
+
+        refs = context.refs()
+        try:
+            await self._session_store.save(session.id, context.snapshot(refs))
+        except Exception:
+            # The state can not be stored so keep the session in memory
+            return False
+
+        if node_fut.done() or context.rerender_paths:
+            # State changed while saving, so the session is not idle anymore
+            await self._session_store.delete(session.id)
+            return False
+
+        # From here on state updates are kept until the session is loaded
+        context.detach(refs)
+        node_fut.cancel()
+        await asyncio.wait({node_fut})
+        await nodes.aclose()
+        return True
+
+    async def _load_session(self, session):
+        # Renders a stored session again from its snapshot. Returns the tree
+        # the client has, the new tree if the state changed while the session
+        # was stored and None otherwise, and the render generator.
+        snapshot = await self._session_store.load(session.id)
+        node, trees = await self._render(session, snapshot)
+        if not session.context.updates:
+            session.context.attach(snapshot)
+            return node, None, trees
+
+        await trees.aclose()
+        new_node, trees = await self._render(session, session.context.attach(snapshot))
+        return node, new_node, trees
+
+    async def _render(self, session, snapshot=None):
+        token = SESSION.set(session)
+        try:
+            trees = render(self._node, session, self._frame_time, snapshot, self._tracer)
+            tree, _ = await anext(trees)
+        finally:
+            SESSION.reset(token)
+        return tree, trees
+
+    def _diff(self, node, new_node, dirty=None):
+        if self._tracer is None:
+            return diff(node, new_node, dirty)
+        start = perf_counter()
+        actions = list(diff(node, new_node, dirty))
+        self._tracer.diff(len(actions), perf_counter() - start)
+        return actions
+
+    def _new_session_id(self):
+        if self._router is None:
+            return None
+        return self._router.new_session_id(str(uuid4()))
+
+    def invalidate(self, url=None):
+        # Renders url, or all urls if url is None, again on the next request
+        # instead of serving them from the page cache
+        if self._page_cache is not None:
+            self._page_cache.invalidate(url)
@@ -0,0 +1,71 @@
+from collections import OrderedDict, namedtuple
+from time import monotonic
+
+
+Page = namedtuple('Page', ['id', 'url', 'tree', 'html', 'expires'])
+
+
+class PageCache:
+
+    # Caches the first render of pages by url, for apps where the first
+    # render only depends on the url. Pages that expire or are invalidated
+    # are no longer served, but stay available by id until they are evicted
+    # so clients that already have the page can still connect. When there are
+    # more than max_pages pages or they are more than max_bytes in total the
+    # least recently used pages are evicted.
+
+    def __init__(self, ttl=None, max_pages=1000, max_bytes=None):
+        self._ttl = ttl
+        self._max_pages = max_pages
+        self._max_bytes = max_bytes
+        self._pages = OrderedDict()
+        self._urls = {}
+        self._bytes = 0
+
+    def __len__(self):
+        return len(self._pages)
+
+    def get(self, url):
+        try:
+            page = self._pages[self._urls[url]]
+        except KeyError:
+            return None
+        if page.expires is not None and page.expires <= monotonic():
+            del self._urls[url]
+            return None
+        self._pages.move_to_end(page.id)
+        return page
+
+    def get_page(self, page_id):
+        try:
+            page = self._pages[page_id]
+        except KeyError:
+            return None
+        self._pages.move_to_end(page_id)
+        return page
+
+    def add(self, page_id, url, tree, html):
+        expires = None if self._ttl is None else monotonic() + self._ttl
+        page = Page(page_id, url, tree, html, expires)
+        self._pages[page_id] = page
+        self._urls[url] = page_id
+        self._bytes += len(html)
+
+        while len(self._pages) > 1 and (
+            (self._max_pages is not None and len(self._pages) > self._max_pages) or
+            (self._max_bytes is not None and self._bytes > self._max_bytes)
+        ):
+            _, evicted = self._pages.popitem(last=False)
+            self._bytes -= len(evicted.html)
+            if self._urls.get(evicted.url) == evicted.id:
+                del self._urls[evicted.url]
+
+        return page
+
+    def invalidate(self, url=None):
+        # Makes the next request for url, or all urls if url is None, render
+        # the page again
+        if url is None:
+            self._urls.clear()
+        else:
+            self._urls.pop(url, None)
@@ -0,0 +1,160 @@
+import json
+import zlib
+
+
+# The number of arguments after the path for every action, for all encodings
+# other than the plain encoding actions are sent as their index in this dict.
+ACTIONS = {
+    'create': 2,
+    'delete': 1,
+    'replace': 2,
+    'move': 2,
+    'order': 1,
+    'set': 2,
+    'unset': 1,
+    'push_url': 1,
+    'replace_url': 1,
+}
+OPCODES = {action: opcode for opcode, action in enumerate(ACTIONS)}
+
+
+class PlainEncoder:
+
+    def encode(self, actions):
+        return {'text': json.dumps(actions, separators=(',', ':'))}
+
+
+class CompactEncoder:
+
+    # Actions are encoded as [opcode, shared, *path, *args] where shared is
+    # the length of the prefix of the path that is the same as the path of
+    # the previous action. Tags and attribute names are interned for the
+    # whole connection: the first time a string is sent it is sent as is and
+    # gets the next index, after that only the index is sent.
+
+    def __init__(self):
+        self._strings = {}
+
+    def encode(self, actions):
+        return {'text': json.dumps(self.compact(actions), separators=(',', ':'))}
+
+    def compact(self, actions):
+        res = []
+        prev_path = ()
+
+        for action, *path in actions:
+            arity = ACTIONS[action]
+            args = path[len(path) - arity:]
+            path = path[:len(path) - arity]
+
+            shared = 0
+            for key, prev_key in zip(path, prev_path):
+                if key != prev_key:
+                    break
+                shared += 1
+            prev_path = path
+
+            match action:
+                case 'create' | 'replace':
+                    index, node = args
+                    args = [index, self.compact_node(node)]
+                case 'set' | 'unset':
+                    key, *args = args
+                    args = [self.intern(key), *args]
+
+            res.append([OPCODES[action], shared, *path[shared:], *args])
+
+        return res
+
+    def compact_node(self, node):
+        if isinstance(node, str):
+            return node
+
+        tag, props, *children = node
+        tag = self.intern(tag)
+        flat_props = []
+        for key, value in props.items():
+            flat_props.append(self.intern(key))
+            flat_props.append(value)
+        return [tag, flat_props, *map(self.compact_node, children)]
+
+    def intern(self, string):
+        try:
+            return self._strings[string]
+        except KeyError:
+            self._strings[string] = len(self._strings)
+            return string
+
+
+class BinaryEncoder(CompactEncoder):
+
+    # Same as the compact encoding but packed into a binary frame. Every value
+    # starts with a varint header, the lowest 2 bits of the header give the
+    # type and the rest the value for integers, the number of bytes for
+    # strings and the number of items for lists.
+
+    def encode(self, actions):
+        data = bytearray()
+        pack(self.compact(actions), data)
+        return {'bytes': bytes(data)}
+
+
+INT = 0
+STR = 1
+LIST = 2
+COMPRESSED = 3
+
+# Kinds of compressed payloads, stored in the header of a compressed frame
+TEXT_PAYLOAD = 0
+BINARY_PAYLOAD = 1
+
+
+def pack(value, data):
+    if isinstance(value, int):
+        assert value >= 0
+        pack_varint(value << 2 | INT, data)
+    elif isinstance(value, str):
+        encoded = value.encode()
+        pack_varint(len(encoded) << 2 | STR, data)
+        data.extend(encoded)
+    else:
+        pack_varint(len(value) << 2 | LIST, data)
+        for subvalue in value:
+            pack(subvalue, data)
+
+
+def pack_varint(value, data):
+    while value >= 0x80:
+        data.append(value & 0x7f | 0x80)
+        value >>= 7
+    data.append(value)
+
+
+def compress(message, threshold, level=-1):
+    # Compresses the payload of a message with zlib if it is at least
+    # threshold bytes, compressed payloads are sent as a binary frame that
+    # starts with a header with the COMPRESSED type. Returns the message and
+    # the size of the payload before and after compression.
+    try:
+        data = message['text'].encode()
+    except KeyError:
+        data = message['bytes']
+        kind = BINARY_PAYLOAD
+    else:
+        kind = TEXT_PAYLOAD
+
+    if threshold is not None and len(data) >= threshold:
+        compressed = bytearray()
+        pack_varint(kind << 2 | COMPRESSED, compressed)
+        compressed.extend(zlib.compress(data, level))
+        if len(compressed) < len(data):
+            return {'bytes': bytes(compressed)}, len(data), len(compressed)
+
+    return message, len(data), len(data)
+
+
+ENCODERS = {
+    'plain': PlainEncoder,
+    'compact': CompactEncoder,
+    'binary': BinaryEncoder,
+}
@@ -1,55 +1,106 @@
+from contextlib import aclosing
+
+from ..paths import Paths
 from ..tree import Tree
-from ..render import render as base_render
+from ..render import Context, render as base_render
 
 
-async def render(node, session_id):
+async def render(node, session, frame_time=0, snapshot=None, tracer=None):
     script = Tree('script', {
-        'src': f'/_pyreact.js?session={session_id}',
+        'src': f'/_pyreact.js?session={session.page_id}',
         'defer': True,
     }, {})
 
-    async for tree in base_render(node):
-        html = Tree('html', {}, {
-            ('head',): Tree('head', {}, {}),
-            ('body',): Tree('body', {}, {}),
-        })
-        add_tree(html, (), tree)
-        html[0].children[('script',)] = script
-        yield html
+    if session.context is None:
+        session.context = Context(frame_time, snapshot, tracer)
+    else:
+        # Callbacks of earlier renders of the session keep their context, so
+        # their rerenders end up in this render
+        session.context.restore = snapshot
 
+    async with aclosing(base_render(node, context=session.context)) as trees:
+        async for tree, dirty in trees:
+            html_props = {}
+            head_props = {}
+            body_props = {}
+            head_children = {}
+            body_children = {}
 
-def add_tree(html, key, tree):
-    head, body = html
+            containers = {
+                'html': (html_props, None),
+                'head': (head_props, head_children),
+                'body': (body_props, body_children),
+            }
+            add_tree(containers, (), tree)
+            head_children[('script',)] = script
 
-    if isinstance(tree, str):
-        body.children[key] = tree
+            html = Tree('html', html_props, {
+                ('head',): Tree('head', head_props, head_children),
+                ('body',): Tree('body', body_props, body_children),
+            })
+            yield html, add_dirty(tree, dirty)
 
-    elif tree.tag is None:
-        for subkey, child in tree.children.items():
-            add_tree(html, (*key, *subkey), child)
 
-    elif tree.tag == 'html':
-        html.props.extend(tree.props)
-        for subkey, child in tree.children.items():
-            add_tree(html, (*key, *subkey), child)
+def add_tree(containers, key, tree):
+    _, body_children = containers['body']
+
+    if isinstance(tree, str):
+        body_children[key] = tree
 
-    elif tree.tag == 'head':
-        head.props.extend(tree.props)
+    elif tree.tag is None or tree.tag == 'html':
+        props, _ = containers['html']
+        props.update(tree.props)
         for subkey, child in tree.children.items():
-            add_tree_inner(head, (*key, *subkey), child)
+            add_tree(containers, (*key, *subkey), child)
 
-    elif tree.tag == 'body':
-        body.props.extend(tree.props)
+    elif tree.tag in ('head', 'body'):
+        props, children = containers[tree.tag]
+        props.update(tree.props)
         for subkey, child in tree.children.items():
-            add_tree_inner(body, (*key, *subkey), child)
+            add_tree_inner(children, (*key, *subkey), child)
 
     else:
-        body.children[key] = tree
+        body_children[key] = tree
 
 
-def add_tree_inner(html, key, tree):
+def add_tree_inner(children, key, tree):
     if isinstance(tree, str) or tree.tag is not None:
-        body.children[key] = tree
+        children[key] = tree
     else:
         for subkey, child in tree.children.items():
-            add_tree_inner(html, (*key, *subkey), child)
+            add_tree_inner(children, (*key, *subkey), child)
+
+
+def add_dirty(tree, dirty):
+    if dirty is None:
+        return None
+
+    html_dirty = Paths()
+    for path in dirty:
+        try:
+            html_path = get_html_path(tree, path)
+        except KeyError:
+            html_path = None
+        if html_path is None:
+            return None
+        html_dirty.cover(html_path)
+    return html_dirty
+
+
+def get_html_path(tree, path, key=(), container=None):
+    # Mirrors add_tree to find where the subtree at path ends up in the html
+    # tree, returns None if the subtree is spread out over multiple places.
+    if isinstance(tree, str) or (tree.tag is not None and (
+        container is not None or
+        tree.tag not in ('html', 'head', 'body')
+    )):
+        return (('head',) if container == 'head' else ('body',), key, *path)
+
+    if not path:
+        return None
+
+    if tree.tag in ('head', 'body'):
+        container = tree.tag
+
+    subkey, *path = path
+    return get_html_path(tree.children[subkey], path, (*key, *subkey), container)
@@ -1,9 +1,9 @@
 import asyncio
 from contextvars import ContextVar
 from collections import Counter
+from types import SimpleNamespace
 from uuid import uuid4
 
-from ..render import CONTEXT
 from ..hooks import use_ref, use_callback
 from ..node import component, h, prevent_default
 
@@ -13,21 +13,24 @@ SESSION = ContextVar('session')
 
 class Session:
 
-    def __init__(self, scope):
-        self.id = str(uuid4())
+    def __init__(self, scope, session_id=None, page_id=None):
+        self.id = str(uuid4()) if session_id is None else session_id
+        # The id the client connects with, which is the id of the cached page
+        # for sessions created from the page cache
+        self.page_id = self.id if page_id is None else page_id
 
         self.actions = []
         self.actions_event = asyncio.Event()
 
-        self._context = None
+        # Set by the first render, the same context is used every time the
+        # session is rendered from scratch
+        self.context = None
         self.url = scope['path']
         self.url_paths = Counter()
 
-    @property
-    def context(self):
-        if self._context is None:
-            self._context = CONTEXT.get()
-        return self._context
+        # Sizes of the patch payloads sent over the websocket, raw_bytes is the
+        # size before compression and sent_bytes the size after.
+        self.stats = SimpleNamespace(messages=0, raw_bytes=0, sent_bytes=0)
 
     def replace_url(self, url):
         self.set_url(url)
@@ -52,6 +55,10 @@ def get_url():
     return SESSION.get().url
 
 
+def get_stats():
+    return SESSION.get().stats
+
+
 def push_url(url):
     SESSION.get().push_url(url)
 
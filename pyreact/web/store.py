@@ -0,0 +1,136 @@
+import asyncio
+import pickle
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+
+
+class PendingSessions:
+
+    # Sessions that have been rendered over http but whose websocket has not
+    # connected yet. Sessions that are not claimed within ttl seconds are
+    # evicted, and when there are more than max_sessions the oldest ones are
+    # evicted first. Evicting a session closes its render generator, which
+    # unmounts the tree. Lazy sessions are added without tree and generator.
+
+    def __init__(self, ttl=None, max_sessions=None):
+        self._ttl = ttl
+        self._max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._timer = None
+        self._closing = set()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def add(self, session, tree, trees):
+        loop = asyncio.get_running_loop()
+        expires = None if self._ttl is None else loop.time() + self._ttl
+        self._sessions[session.id] = expires, session, tree, trees
+
+        if self._max_sessions is not None:
+            while len(self._sessions) > self._max_sessions:
+                self._evict(next(iter(self._sessions)))
+
+        if self._ttl is not None and self._timer is None:
+            self._timer = loop.call_later(self._ttl, self._expire)
+
+    def pop(self, session_id):
+        _, session, tree, trees = self._sessions.pop(session_id)
+        return session, tree, trees
+
+    async def aclose(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._sessions:
+            self._evict(next(iter(self._sessions)))
+        if self._closing:
+            await asyncio.wait(self._closing)
+
+    def _expire(self):
+        # All sessions have the same ttl so they expire in insertion order
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        self._timer = None
+
+        for session_id, (expires, *_) in list(self._sessions.items()):
+            if expires > now:
+                self._timer = loop.call_at(expires, self._expire)
+                break
+            self._evict(session_id)
+
+    def _evict(self, session_id):
+        _, _, _, trees = self._sessions.pop(session_id)
+        if trees is None:
+            return
+        task = asyncio.get_running_loop().create_task(trees.aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+
+class SessionStore(ABC):
+
+    # Stores snapshots of the hook state of idle sessions, see
+    # Context.snapshot, so the session can be rendered again with the same
+    # state when it is used again.
+
+    @abstractmethod
+    async def save(self, session_id, snapshot):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def load(self, session_id):
+        # Returns the snapshot and removes it from the store
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, session_id):
+        raise NotImplementedError
+
+
+class MemoryStore(SessionStore):
+
+    # Still saves memory since only the state values are kept and not the
+    # nodes, trees and other refs of the session.
+
+    def __init__(self):
+        self._snapshots = {}
+
+    async def save(self, session_id, snapshot):
+        self._snapshots[session_id] = snapshot
+
+    async def load(self, session_id):
+        return self._snapshots.pop(session_id)
+
+    async def delete(self, session_id):
+        self._snapshots.pop(session_id, None)
+
+
+class FileStore(SessionStore):
+
+    # Pickles every snapshot to its own file in directory, so all state
+    # values have to be picklable.
+
+    def __init__(self, directory):
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, session_id):
+        return self._directory / f'{session_id}.pickle'
+
+    async def save(self, session_id, snapshot):
+        data = pickle.dumps(snapshot)
+        await asyncio.to_thread(self._path(session_id).write_bytes, data)
+
+    async def load(self, session_id):
+        path = self._path(session_id)
+        data = await asyncio.to_thread(path.read_bytes)
+        await asyncio.to_thread(path.unlink)
+        return pickle.loads(data)
+
+    async def delete(self, session_id):
+        await asyncio.to_thread(self._path(session_id).unlink, missing_ok=True)
@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+from base64 import b64decode, b64encode
+from pathlib import Path
+
+
+class WorkerRouter:
+
+    # Routes websockets to the worker process that rendered their session,
+    # for when the app runs in multiple processes like with `uvicorn
+    # --workers N`. Every worker listens on a unix socket in directory named
+    # after its pid, and session ids start with the pid of the worker that
+    # created them. A websocket that ends up at another worker is forwarded
+    # over the unix socket of the owner, which handles it like any other
+    # websocket.
+
+    def __init__(self, directory):
+        self._directory = Path(directory)
+        self._server = None
+        self.id = None
+
+    def _path(self, worker_id):
+        return self._directory / f'{worker_id}.sock'
+
+    def new_session_id(self, session_id):
+        return f'{self.id}.{session_id}'
+
+    def get_owner(self, session_id):
+        owner, sep, _ = session_id.partition('.')
+        if not sep or not owner.isdigit():
+            return None
+        return owner
+
+    async def start(self, handler):
+        if self._server is not None:
+            return
+
+        self.id = str(os.getpid())
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+        async def handle_connection(reader, writer):
+            try:
+                scope = await read_message(reader)
+
+                async def receive():
+                    try:
+                        return await read_message(reader)
+                    except (asyncio.IncompleteReadError, ConnectionError):
+                        return {'type': 'websocket.disconnect', 'code': 1006}
+
+                async def send(message):
+                    await write_message(writer, message)
+
+                await handler(scope, receive, send)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        self._server = await asyncio.start_unix_server(
+            handle_connection,
+            self._path(self.id),
+        )
+
+    async def aclose(self):
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        self._path(self.id).unlink(missing_ok=True)
+
+    async def forward(self, owner, scope, receive, send):
+        try:
+            reader, writer = await asyncio.open_unix_connection(self._path(owner))
+        except OSError:
+            # The owner is gone, and so is the session
+            await receive()
+            await send({'type': 'websocket.close'})
+            return
+
+        async def forward_receive():
+            while True:
+                message = await receive()
+                await write_message(writer, message)
+                if message['type'] == 'websocket.disconnect':
+                    break
+
+        receive_task = asyncio.create_task(forward_receive())
+        try:
+            # Only the path is used to handle a websocket, the rest of the
+            # scope is not necessarily serializable
+            await write_message(writer, {'type': 'websocket', 'path': scope['path']})
+            while True:
+                try:
+                    message = await read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                await send(message)
+        finally:
+            receive_task.cancel()
+            await asyncio.wait({receive_task})
+            writer.close()
+
+
+async def read_message(reader):
+    size = int.from_bytes(await reader.readexactly(4))
+    message = json.loads(await reader.readexactly(size))
+    if message.get('bytes') is not None:
+        message['bytes'] = b64decode(message['bytes'])
+    return message
+
+
+async def write_message(writer, message):
+    if message.get('bytes') is not None:
+        message = {**message, 'bytes': b64encode(message['bytes']).decode()}
+    data = json.dumps(message, separators=(',', ':')).encode()
+    writer.write(len(data).to_bytes(4))
+    writer.write(data)
+    await writer.drain()